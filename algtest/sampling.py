@@ -2,6 +2,7 @@ import random
 import argparse
 import os
 import csv
+import gff_lib as gl
 
 parser = argparse.ArgumentParser()
 parser.add_argument('apc_dir', type=str, help='directory with APC genes')
@@ -16,16 +17,13 @@ genes = {}
 for fname in os.listdir(args.apc_dir):
     if fname.endswith('gff3'):
         gid = fname.split('.')[1]
-        with open(f'{args.apc_dir}{fname}') as fp:
-            intron_counts = {}
-            for line in fp.readlines():
-                line = line.rstrip()
-                line = line.split('\t')
-                if line[1] == 'RNASeq_splice' and line[2] == 'intron':
-                    intron = (line[3], line[4])
-                    reads = line[5]
-                    intron_counts[intron] = reads
-            genes[gid] = intron_counts
+        intron_counts = {}
+        for f in gl.gff_features(f'{args.apc_dir}{fname}', 'intron',
+                                 source='RNASeq_splice'):
+            # string coordinates, as read from the gff before gff_lib
+            intron = (str(f['beg']), str(f['end']))
+            intron_counts[intron] = f['score']
+        genes[gid] = intron_counts
 
 for gene in genes:
     total = 0
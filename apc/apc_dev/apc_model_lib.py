@@ -1,6 +1,7 @@
 import sys
 import gzip
 import math
+import numpy as np
 import openturns as ot
 from itertools import combinations
 
@@ -117,64 +118,95 @@ def get_exinbins(exinseqs, nbins=None, pre=None):
 
 # definitions of rectangular and triangular smoothing found here:
 # https://terpconnect.umd.edu/~toh/spectrum/Smoothing.html
+# kernels are odd length and sum to 1, smoothing is a convolution
+# edges: 'zero' (default) pads with zeros, 'renorm' divides by the kernel
+# mass inside the data, 'reflect' mirrors the data at each end
+# the old loops differ from 'zero' near the ends: rec_smoo left out the
+# left neighbours of bins 1 to m2-1, tri_smoo used uneven weights at the
+# left end and for m other than 5
+
+def rec_kernel(m):
+
+	m2 = int((m/2) + 0.5 - 1)
+	k = np.ones(2*m2 + 1)
+	return k/k.sum()
+
+def tri_kernel(m):
+
+	m2 = int((m/2) + 0.5 - 1)
+	k = np.concatenate((np.arange(1, m2+2), np.arange(m2, 0, -1)))
+	return k/k.sum()
+
+def gau_kernel(sigma, m=None):
+
+	if m is None: m = 2*int(math.ceil(4*sigma)) + 1
+	m2 = m//2
+	x = np.arange(-m2, m2+1)
+	k = np.exp(-0.5 * (x/sigma)**2)
+	return k/k.sum()
+
+# direct convolution is O(n*m), fft is O(n log n)
+# always len(data) values centered on the data, also for kernels longer than
+# the data, where np.convolve mode='same' returns len(kernel) values
+def convolve(data, kernel, fft=None):
+
+	if fft is None: fft = len(kernel) > 64
+	n = len(data) + len(kernel) - 1
+	if fft:
+		nfft = 1 << (n-1).bit_length()
+		full = np.fft.irfft(np.fft.rfft(data, nfft) * np.fft.rfft(kernel, nfft),
+			nfft)[:n]
+	else:
+		full = np.convolve(data, kernel)
+	beg = (len(kernel) - 1)//2
+	return full[beg:beg+len(data)]
+
+def smooth(intbins, kernel, edge='zero', fft=None):
+
+	data = np.asarray(intbins, dtype=float)
+	m2 = len(kernel)//2
+	if edge == 'reflect':
+		padded = np.pad(data, m2, mode='reflect')
+		return convolve(padded, kernel, fft)[m2:m2+len(data)]
+
+	smoodata = convolve(data, kernel, fft)
+	if edge == 'renorm':
+		mass = convolve(np.ones(len(data)), kernel, fft)
+		smoodata = smoodata/mass
+	else:
+		assert edge == 'zero', f'unknown edge handling {edge}'
+
+	return smoodata
+
+def _smoo_format(smoodata, pre):
+
+	if pre: return [f'{smoopt:.{pre}f}' for smoopt in smoodata]
+	return [float(smoopt) for smoopt in smoodata]
 
 # rectangular smoothing
-def rec_smoo(intbins, m=5, pre=None):
-	
-	smoodata = []
-	for i in range(len(intbins)):
-		m2 = int((m/2) + 0.5 - 1)
-		bef = intbins[i-m2:i]
-		now = intbins[i]
-		aft = intbins[i+1:i+m2+1]
-		total = sum(bef) + now + sum(aft)
-		smoopt = total/m
-		if pre:
-			fmat = f'{smoopt:.{pre}f}'
-			smoodata.append(fmat)
-		else:
-			smoodata.append(smoopt)
-		#print(bef, now, aft, total, smoopt)
+def rec_smoo(intbins, m=5, pre=None, edge='zero'):
 	
-	return smoodata
+	return _smoo_format(smooth(intbins, rec_kernel(m), edge=edge), pre)
 
 # triangular smoothing
-def tri_smoo(intbins, m=5, pre=None):	
+def tri_smoo(intbins, m=5, pre=None, edge='zero'):	
 
-	smoodata = []
-	m2 = int((m/2) + 0.5 - 1)
-	for i in range(len(intbins)):
-		inx = i-m2
-		if inx < 0: inx = 0
-		bef = intbins[inx:i]
-		now = intbins[i]
-		aft = intbins[i+1:i+m2+1]
-		nowx = now * (m2 + 1)
-		tbefx = 0
-		cbefx = 0
-		for j in range(len(bef)):
-			coefb = m2 - 1 + j
-			befx = bef[j] * coefb
-			tbefx += befx
-			cbefx += coefb
-		taftx = 0
-		caftx = 0
-		for k in range(len(aft)):
-			coefa = m2 - k
-			aftx = aft[k] * coefa
-			taftx += aftx
-			caftx += coefa
-		total_coef = (m2 + 1) + cbefx + caftx
-		total = nowx + tbefx + taftx
-		smoopt = total/total_coef
-		if pre: 
-			fmat = f'{smoopt:.{pre}f}'
-			smoodata.append(fmat)
-		else:
-			smoodata.append(smoopt)
-		#print(bef, now, aft, total, smoopt)
+	return _smoo_format(smooth(intbins, tri_kernel(m), edge=edge), pre)
 
-	return smoodata
+# gaussian smoothing, sigma in bins
+def gau_smoo(intbins, sigma=2, pre=None, edge='zero'):
+
+	return _smoo_format(smooth(intbins, gau_kernel(sigma), edge=edge), pre)
+
+# one row per smoothing width, for picking the width of a len model
+def smoo_scan(intbins, widths, kind='rec', edge='zero'):
+
+	kernels = {'rec': rec_kernel, 'tri': tri_kernel, 'gau': gau_kernel}
+	scan = np.zeros((len(widths), len(intbins)))
+	for i, w in enumerate(widths):
+		scan[i] = smooth(intbins, kernels[kind](w), edge=edge)
+
+	return scan
 
 ##### curve fitting #####
 
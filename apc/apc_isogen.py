@@ -24,6 +24,8 @@ parser.add_argument('--flank', required=False, type=int, default=99,
 	metavar='<int>', help='length of genomic flank on each side %(default)d')
 parser.add_argument('--limit', required=False, type=int, default=20, 
 	metavar='<int>', help='limit number of saved apc isoforms %(default)d')
+parser.add_argument('--save', required=False, type=str, metavar='<file>',
+	help='save all scored isoforms to .json before --limit, see limit_scan.py')
 
 # probabilistic models
 parser.add_argument('--elen', required=False, type=str, metavar='<file>', 
@@ -71,59 +73,30 @@ else:
 abc_isoforms, trials = im.apc(dons, accs, args.maxs, args.minin, 
 							  args.minex, args.flank, seq)
 
-re_elen = im.read_len(args.elen) if args.elen else None
-re_ilen = im.read_len(args.ilen) if args.ilen else None
-re_emm = im.read_mm(args.emm) if args.emm else None
-re_imm = im.read_mm(args.imm) if args.imm else None
-re_dpwm = im.read_pwm(args.dpwm) if args.dpwm else None
-re_apwm = im.read_pwm(args.apwm) if args.apwm else None
-
-escores = {}
-iscores = {}
-dscores = {}
-ascores = {}
-for iso in abc_isoforms:
-	for exon in iso['exons']:
-		if exon in escores: continue
-		if args.elen: 
-			elen_score = im.score_len(re_elen, exon) * args.welen
-		else:
-			elen_score = 0
-		if args.emm: 
-			emm_score = im.score_mm(re_emm, exon, seq) * args.wemm
-		else:
-			emm_score = 0
-		escores[exon] = elen_score + emm_score
-	for intron in iso['introns']:
-		if intron in iscores: continue
-		if args.ilen: 
-			ilen_score = im.score_len(re_ilen, intron) * args.wilen
-		else:
-			ilen_score = 0
-		if args.imm:
-			imm_score = im.score_mm(re_imm, intron, seq, re_dpwm, re_apwm) \
-				* args.wimm
-		else:
-			imm_score = 0
-		dseq, aseq = im.get_daseq(intron, seq)
-		if args.dpwm: 
-			dpwm_score = im.score_pwm(dseq, re_dpwm) * args.wdpwm
-		else:
-			dpwm_score = 0
-		if args.apwm: 
-			apwm_score = im.score_pwm(aseq, re_apwm) * args.wapwm
-		else:
-			apwm_score = 0
-		iscores[intron] = ilen_score + imm_score + dpwm_score + apwm_score
-		dscores[intron] = dpwm_score
-		ascores[intron] = apwm_score
-	for exon in iso['exons']:
-		iso['score'] += escores[exon]
-	for intron in iso['introns']:
-		iso['score'] += iscores[intron]
-	iso['score'] -= len(iso['introns']) * args.icost * 100
+mdls = {
+	'elen': im.read_len(args.elen) if args.elen else None,
+	'ilen': im.read_len(args.ilen) if args.ilen else None,
+	'emm': im.read_mm(args.emm) if args.emm else None,
+	'imm': im.read_mm(args.imm) if args.imm else None,
+	'dpwm': im.read_pwm(args.dpwm) if args.dpwm else None,
+	'apwm': im.read_pwm(args.apwm) if args.apwm else None
+}
+wts = {
+	'elen': args.welen,
+	'ilen': args.wilen,
+	'emm': args.wemm,
+	'imm': args.wimm,
+	'dpwm': args.wdpwm,
+	'apwm': args.wapwm
+}
+
+escores, iscores, dscores, ascores = im.score_isoforms(abc_isoforms, seq, 
+	mdls, wts, args.icost)
 
 abc_isoforms = sorted(abc_isoforms, key=lambda iso: iso['score'], reverse=True)
+if args.save:
+	im.scored_write(abc_isoforms, {'name': seqid.split(' ')[0],
+		'icost': args.icost}, args.save)
 abc_isoforms = abc_isoforms[:args.limit]
 
 '''
@@ -132,16 +105,7 @@ for a in abc_isoforms:
 		print(a['beg'], a['end'], a['exons'], a['introns'], a['score'])
 '''
 
-iso_weights = []
-iso_total = 0
-for iso in abc_isoforms:
-	iso_weight = 2 ** iso['score']
-	iso_weights.append(iso_weight)
-	iso_total += iso_weight
-
-iso_probs = []
-for w in iso_weights:
-	iso_probs.append(w / iso_total)
+iso_probs = im.get_iso_probs(abc_isoforms)
 
 exon_counts = {}
 intron_counts = {}
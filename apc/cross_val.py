@@ -0,0 +1,150 @@
+import argparse
+import copy
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+import isomod as im
+import mkmdls_lib as ml
+import mdist_lib as mdl
+
+parser = argparse.ArgumentParser(
+	description='k-fold cross-validation of apc models')
+parser.add_argument('wb_dir', type=str, metavar='<directory>',
+	help='directory with apc dataset gff and fasta files')
+parser.add_argument('--k', required=False, type=int, default=10,
+	metavar='<int>', help='number of folds [%(default)i]')
+parser.add_argument('--cpus', required=False, type=int, default=1,
+	metavar='<int>', help='number of CPUs to use [%(default)i]')
+parser.add_argument('--seed', required=False, type=int, default=1,
+	metavar='<int>', help='random seed for fold assignment [%(default)i]')
+parser.add_argument('--cache', required=False, type=str, metavar='<file>',
+	help='per-gene counts cache .json, created if missing')
+parser.add_argument('--outfile', required=False, type=str, metavar='<file>',
+	help='write per-fold and per-gene results to .json')
+parser.add_argument('--read_gff', action='store_true',
+	help='get don/acc sites from gff files in wb_dir')
+
+# apc parameters
+parser.add_argument('--maxs', required=False, type=int, default=3,
+	metavar='<int>', help='maximum number of splicing events %(default)d')
+parser.add_argument('--minin', required=False, type=int, default=35,
+	metavar='<int>', help='minimum length of intron %(default)d')
+parser.add_argument('--minex', required=False, type=int, default=25,
+	metavar='<int>', help='minimum length of exon %(default)d')
+parser.add_argument('--flank', required=False, type=int, default=99,
+	metavar='<int>', help='length of genomic flank on each side %(default)d')
+parser.add_argument('--limit', required=False, type=int, default=20,
+	metavar='<int>', help='limit number of saved apc isoforms %(default)d')
+parser.add_argument('--icost', required=False, type=float, default=0.0,
+	metavar='<float>', help='intron cost %(default).2f')
+
+args = parser.parse_args()
+
+fastas, gffs = ml.get_gene_paths(args.wb_dir)
+gids = sorted(gffs)
+
+def count_worker(gid):
+	return ml.count_gene(gid, fastas[gid], gffs[gid])
+
+def init_worker(models):
+	global fold_models
+	fold_models = models
+
+# same scoring as apc_isogen.py, mdist as in icost_scoring.py
+# a gene that fails is reported with its error, the other genes still count
+def score_worker(job):
+
+	fold, gid = job
+	try:
+		return fold, gid, score_gene(fold, gid), None
+	except Exception as e:
+		return fold, gid, None, f'{type(e).__name__}: {e}'
+
+def score_gene(fold, gid):
+
+	seqid, seq = im.read_fasta(fastas[gid])
+	if args.read_gff:
+		dons, accs = im.read_gff_sites(seq, gffs[gid])
+	else:
+		dons, accs = im.get_gtag(seq, args.flank, args.minex)
+
+	isoforms, trials = im.apc(dons, accs, args.maxs, args.minin, args.minex,
+		args.flank, seq)
+	if len(isoforms) == 0: return None
+
+	wts = {'elen': 1, 'ilen': 1, 'emm': 1, 'imm': 1, 'dpwm': 1, 'apwm': 1}
+	im.score_isoforms(isoforms, seq, fold_models[fold], wts, args.icost)
+	isoforms = sorted(isoforms, key=lambda iso: iso['score'], reverse=True)
+	isoforms = isoforms[:args.limit]
+	iso_probs = im.get_iso_probs(isoforms)
+
+	introns1 = mdl.get_apc_intron_probs(isoforms, iso_probs)
+	introns2 = mdl.get_gff_intron_probs(gffs[gid])
+
+	return mdl.get_mdist(introns1, introns2)
+
+starttime = time.time()
+pool = mp.Pool(args.cpus)
+
+# counts for every gene are shared by all folds
+gene_counts = {}
+if args.cache and os.path.exists(args.cache):
+	with open(args.cache, 'r') as fp:
+		gene_counts = json.load(fp)
+todo = [gid for gid in gids if gid not in gene_counts]
+for gcounts in pool.imap_unordered(count_worker, todo):
+	gene_counts[gcounts['genes'][0]] = gcounts
+if args.cache and len(todo) > 0:
+	with open(args.cache, 'w') as fp:
+		json.dump(gene_counts, fp)
+
+total = ml.new_counts()
+for gid in gids:
+	ml.update_counts(total, gene_counts[gid])
+
+shuffled = gids.copy()
+random.Random(args.seed).shuffle(shuffled)
+folds = [sorted(shuffled[i::args.k]) for i in range(args.k)]
+
+# each fold model is the total minus the held out genes
+models = []
+for fold in folds:
+	train = copy.deepcopy(total)
+	for gid in fold:
+		ml.update_counts(train, gene_counts[gid], sign=-1)
+	models.append(ml.score_models(ml.build_models(train)))
+pool.close()
+
+jobs = [(f, gid) for f in range(len(folds)) for gid in folds[f]]
+pool = mp.Pool(args.cpus, initializer=init_worker, initargs=(models,))
+results = {f: {} for f in range(len(folds))}
+errors = {f: {} for f in range(len(folds))}
+for fold, gid, mdist, error in pool.imap_unordered(score_worker, jobs):
+	results[fold][gid] = mdist
+	if error:
+		errors[fold][gid] = error
+		print('failed:', gid, error, file=sys.stderr)
+pool.close()
+endtime = time.time()
+
+summary = []
+for fold in results:
+	mdists = [results[fold][gid][0] for gid in results[fold]
+		if results[fold][gid] is not None]
+	avg = sum(mdists)/len(mdists) if len(mdists) > 0 else None
+	print('fold:', fold, 'genes:', len(folds[fold]), 'avg mdist:', avg)
+	summary.append({
+		'fold': fold,
+		'genes': folds[fold],
+		'avg_mdist': avg,
+		'mdists': results[fold],
+		'errors': errors[fold]
+	})
+print('time:', endtime-starttime)
+
+if args.outfile:
+	with open(args.outfile, 'w') as fp:
+		fp.write(json.dumps(summary, indent=4))
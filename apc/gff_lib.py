@@ -0,0 +1,72 @@
+import os
+from functools import lru_cache
+
+# one pass over a gff3, features are indexed by seqid, type and source
+# index[seqid][type][source] = [feature, ...] in file order
+# feature = {'beg', 'end', 'score', 'strand', 'attr', 'n'}
+# score is None for '.', n is the line number, used to merge sources
+# the index is cached, callers must not modify it
+
+def parse_gff(gff):
+
+	index = {}
+	with open(gff, 'r') as fp:
+		n = 0
+		for line in fp:
+			n += 1
+			if line.startswith('#'): continue
+			line = line.rstrip('\n').split('\t')
+			if len(line) < 8: continue
+			seqid, source, ftype = line[0], line[1], line[2]
+			score = None if line[5] == '.' else float(line[5])
+			feature = {
+				'beg': int(line[3]),
+				'end': int(line[4]),
+				'score': score,
+				'strand': line[6],
+				'attr': line[8] if len(line) > 8 else '',
+				'n': n
+			}
+			if seqid not in index: index[seqid] = {}
+			if ftype not in index[seqid]: index[seqid][ftype] = {}
+			if source not in index[seqid][ftype]:
+				index[seqid][ftype][source] = []
+			index[seqid][ftype][source].append(feature)
+
+	return index
+
+# file is re-read only if its size or modification time change
+@lru_cache(maxsize=64)
+def _cached_gff(path, mtime, size):
+	return parse_gff(path)
+
+def read_gff(gff):
+
+	path = os.path.abspath(gff)
+	st = os.stat(path)
+	return _cached_gff(path, st.st_mtime_ns, st.st_size)
+
+# source=None merges all sources, seqid=None merges all seqids
+# features keep their original file order
+def get_features(index, ftype, source=None, seqid=None):
+
+	seqids = [seqid] if seqid else list(index)
+	features = []
+	for sid in seqids:
+		if sid not in index or ftype not in index[sid]: continue
+		if source is None:
+			for src in index[sid][ftype]:
+				features += index[sid][ftype][src]
+		elif source in index[sid][ftype]:
+			features += index[sid][ftype][source]
+
+	if source is None or seqid is None:
+		features = sorted(features, key=lambda f: f['n'])
+
+	return features
+
+def gff_features(gff, ftype, source=None, seqid=None):
+	return get_features(read_gff(gff), ftype, source=source, seqid=seqid)
+
+def cache_info():
+	return _cached_gff.cache_info()
@@ -1,8 +1,10 @@
 import sys
 import gzip
+import json
 import math
 import os
 from itertools import combinations
+import gff_lib as gl
 
 ################################
 ##### File Reading Section #####
@@ -26,21 +28,17 @@ def read_gff_sites(seq, gff, gtag=True):
 	dons = []
 	accs = []
 
-	with open(gff) as fp:
-		for line in fp.readlines():
-			line = line.rstrip()
-			line = line.split('\t')
-			if line[2] == 'intron':
-				beg = int(line[3]) - 1
-				end = int(line[4])
-				if gtag:
-					if seq[beg:beg+2] == 'GT': 
-						dons.append(beg-1)
-					if seq[end-2:end] == 'AG': 
-						accs.append(end-1)
-				if not gtag: 
-					dons.append(beg-1)
-					accs.append(end-1)	
+	for f in gl.gff_features(gff, 'intron'):
+		beg = f['beg'] - 1
+		end = f['end']
+		if gtag:
+			if seq[beg:beg+2] == 'GT': 
+				dons.append(beg)
+			if seq[end-2:end] == 'AG': 
+				accs.append(end-1)
+		if not gtag: 
+			dons.append(beg)
+			accs.append(end-1)	
 
 	return sorted(set(dons)), sorted(set(accs))
 
@@ -50,24 +48,19 @@ def get_subseqs(seq, gff):
 	iseqs = []
 	dseqs = []
 	aseqs = []
-	with open(gff, 'r') as fp:
-		for line in fp.readlines():
-			line = line.rstrip()
-			line = line.split('\t')
-			if line[1] == 'WormBase' and line[2] == 'exon':
-				beg = int(line[3])
-				end = int(line[4])
-				eseq = seq[beg-1:end]
-				eseqs.append(eseq)
-			if line[1] == 'WormBase' and line[2] == 'intron':
-				beg = int(line[3])
-				end = int(line[4])
-				iseq = seq[beg-1:end]
-				iseqs.append(iseq)
-				dseq = seq[beg-1:beg+4]
-				dseqs.append(dseq)
-				aseq = seq[end-6:end]
-				aseqs.append(aseq)
+	index = gl.read_gff(gff)
+	for f in gl.get_features(index, 'exon', source='WormBase'):
+		eseq = seq[f['beg']-1:f['end']]
+		eseqs.append(eseq)
+	for f in gl.get_features(index, 'intron', source='WormBase'):
+		beg = f['beg']
+		end = f['end']
+		iseq = seq[beg-1:end]
+		iseqs.append(iseq)
+		dseq = seq[beg-1:beg+4]
+		dseqs.append(dseq)
+		aseq = seq[end-6:end]
+		aseqs.append(aseq)
 
 	return [eseqs, iseqs, dseqs, aseqs]
 
@@ -77,23 +70,14 @@ def get_subseqs(seq, gff):
 # would it be worth it to only train on the features with the most transcripts?
 def get_top_exins(seq, gff):
 
-	wb_ints = []
-	wb_exos = []
+	index = gl.read_gff(gff)
+	wb_ints = [(f['beg'], f['end']) 
+		for f in gl.get_features(index, 'intron', source='WormBase')]
+	wb_exos = [(f['beg'], f['end']) 
+		for f in gl.get_features(index, 'exon', source='WormBase')]
 	rsplice_ints = {}
-	with open(gff, 'r') as fp:
-		for line in fp.readlines():
-			line = line.rstrip().split('\t')
-			if line[1] == 'WormBase':
-				if line[2] == 'intron':
-					intron = line[3], line[4]
-					wb_ints.append(intron)
-				if line[2] == 'exon':
-					exon = line[3], line[4]
-					wb_exos.append(exon)
-			if line[1] == 'RNASeq_splice':
-				if line[2] == 'intron':
-					intron = int(line[3]), int(line[4])
-					rsplice_ints[intron] = float(line[5])
+	for f in gl.get_features(index, 'intron', source='RNASeq_splice'):
+		rsplice_ints[(f['beg'], f['end'])] = f['score']
 
 	rsplice_ints = {i: j for i, j in sorted(rsplice_ints.items(), 
 								 key=lambda tem: tem[1], reverse=True)}
@@ -349,8 +333,8 @@ def score_len(re_len, exin):
 	if re_len == None: return 0
 
 	length = exin[1] - exin[0]
-	if length > len(re_len):
-		len_prob == 0
+	if length >= len(re_len):
+		len_prob = 0
 	else:
 		len_prob = re_len[length]
 	if len_prob == 0:
@@ -430,6 +414,98 @@ def get_entropy(probs):
 		h -= p * math.log2(p)
 	return h
 
+# mdls and wts use the keys elen, ilen, emm, imm, dpwm, apwm
+# models are in the form returned by read_len/read_mm/read_pwm or None
+def score_isoforms(isoforms, seq, mdls, wts, icost):
+
+	escores = {}
+	iscores = {}
+	dscores = {}
+	ascores = {}
+	for iso in isoforms:
+		for exon in iso['exons']:
+			if exon in escores: continue
+			if mdls['elen']: 
+				elen_score = score_len(mdls['elen'], exon) * wts['elen']
+			else:
+				elen_score = 0
+			if mdls['emm']: 
+				emm_score = score_mm(mdls['emm'], exon, seq) * wts['emm']
+			else:
+				emm_score = 0
+			escores[exon] = elen_score + emm_score
+		for intron in iso['introns']:
+			if intron in iscores: continue
+			if mdls['ilen']: 
+				ilen_score = score_len(mdls['ilen'], intron) * wts['ilen']
+			else:
+				ilen_score = 0
+			if mdls['imm']:
+				imm_score = score_mm(mdls['imm'], intron, seq, mdls['dpwm'], 
+					mdls['apwm']) * wts['imm']
+			else:
+				imm_score = 0
+			dseq, aseq = get_daseq(intron, seq)
+			if mdls['dpwm']: 
+				dpwm_score = score_pwm(dseq, mdls['dpwm']) * wts['dpwm']
+			else:
+				dpwm_score = 0
+			if mdls['apwm']: 
+				apwm_score = score_pwm(aseq, mdls['apwm']) * wts['apwm']
+			else:
+				apwm_score = 0
+			iscores[intron] = ilen_score + imm_score + dpwm_score + apwm_score
+			dscores[intron] = dpwm_score
+			ascores[intron] = apwm_score
+		for exon in iso['exons']:
+			iso['score'] += escores[exon]
+		for intron in iso['introns']:
+			iso['score'] += iscores[intron]
+		iso['score'] -= len(iso['introns']) * icost * 100
+
+	return escores, iscores, dscores, ascores
+
+# weights are shifted by the top score, 2 ** score overflows for large scores
+def get_iso_probs(isoforms):
+
+	if len(isoforms) == 0: return []
+	top = max(iso['score'] for iso in isoforms)
+	iso_weights = []
+	iso_total = 0
+	for iso in isoforms:
+		iso_weight = 2 ** (iso['score'] - top)
+		iso_weights.append(iso_weight)
+		iso_total += iso_weight
+
+	iso_probs = []
+	for w in iso_weights:
+		iso_probs.append(w / iso_total)
+
+	return iso_probs
+
+# all scored isoforms sorted by score, before --limit, with the run info
+# introns are 0-based like apc(), limit_scan.py re-truncates at any limit
+def scored_write(isoforms, info, fpath):
+
+	saved = dict(info)
+	saved['beg'] = isoforms[0]['beg'] if isoforms else 0
+	saved['end'] = isoforms[0]['end'] if isoforms else 0
+	saved['scores'] = [iso['score'] for iso in isoforms]
+	saved['introns'] = [iso['introns'] for iso in isoforms]
+	tmp = f'{fpath}.tmp'
+	with open(tmp, 'w') as fp:
+		json.dump(saved, fp)
+	os.replace(tmp, fpath)
+
+def scored_read(fpath):
+
+	with open(fpath, 'r') as fp:
+		saved = json.load(fp)
+	saved['introns'] = [[tuple(i) for i in introns]
+		for introns in saved['introns']]
+
+	return saved
+
 ##### Markov Model scoring #####
 
 def read_mm(mm_model):
@@ -0,0 +1,97 @@
+import argparse
+import json
+import numpy as np
+import isomod as im
+import mdist_lib as mdl
+
+parser = argparse.ArgumentParser(
+	description='isoform probabilities, complexity and mdist at every --limit')
+parser.add_argument('scored', type=str, metavar='<file>',
+	help='scored isoforms .json from apc_isogen.py --save')
+parser.add_argument('--gff', required=False, type=str, metavar='<file>',
+	help='WormBase .gff3 of the same gene, adds mdist')
+parser.add_argument('--max_limit', required=False, type=int, metavar='<int>',
+	help='highest limit, default all isoforms')
+parser.add_argument('--introns', required=False, type=str, metavar='<file>',
+	help='write intron probabilities and frequencies at every limit to .json')
+
+args = parser.parse_args()
+
+# isoforms are sorted by score, so the top n of every limit n are prefixes
+# and every per-limit sum is a cumulative sum over isoforms
+
+# rows are isoforms, columns are introns in 1-based gff coordinates
+def intron_matrix(iso_introns):
+
+	index = {}
+	for introns in iso_introns:
+		for intron in introns:
+			intron = (intron[0]+1, intron[1]+1)
+			if intron not in index: index[intron] = len(index)
+	m = np.zeros((len(iso_introns), len(index)))
+	for k, introns in enumerate(iso_introns):
+		for intron in introns:
+			m[k, index[(intron[0]+1, intron[1]+1)]] = 1
+
+	return list(index), m
+
+# same as im.get_iso_probs/get_entropy on the top n isoforms, for every n
+# weights are 2**(score - top score), W[n-1] is the total of the top n
+def limit_scan(scores, iso_introns):
+
+	s = np.array(scores, dtype=float) - scores[0]
+	w = np.exp2(s)
+	W = np.cumsum(w)
+	entropy = np.log2(W) - np.cumsum(w * s) / W
+
+	# intron probabilities as mdl.get_apc_intron_probs, without {:.5e}
+	introns, m = intron_matrix(iso_introns)
+	mass = np.cumsum(w[:, None] * m, axis=0)
+	iprobs = mass / mass.sum(axis=1, keepdims=True)
+
+	# intron frequencies as apc_isogen.py infreq
+	counts = np.cumsum(m, axis=0)
+	ifreqs = counts / counts.sum(axis=1, keepdims=True)
+
+	return introns, entropy, iprobs, ifreqs
+
+def limit_mdists(introns, iprobs, ref_introns):
+
+	ref = np.array([ref_introns.get(i, 0) for i in introns])
+	ref_only = sum(ref_introns[i] for i in ref_introns if i not in introns)
+
+	return np.abs(iprobs - ref).sum(axis=1) + ref_only
+
+saved = im.scored_read(args.scored)
+n = len(saved['scores'])
+if args.max_limit: n = min(n, args.max_limit)
+if n == 0: raise SystemExit('no isoforms')
+
+introns, entropy, iprobs, ifreqs = limit_scan(saved['scores'][:n],
+	saved['introns'][:n])
+
+mdists = None
+if args.gff:
+	mdists = limit_mdists(introns, iprobs, mdl.get_gff_intron_probs(args.gff))
+
+print('# name:', saved['name'])
+print('# icost:', saved['icost'])
+print('# isoforms:', len(saved['scores']))
+if mdists is None: print('limit\tcomplexity')
+else: print('limit\tcomplexity\tmdist')
+for i in range(n):
+	if mdists is None: print(f'{i+1}\t{entropy[i]:.4f}')
+	else: print(f'{i+1}\t{entropy[i]:.4f}\t{mdists[i]:.6f}')
+
+if args.introns:
+	limits = []
+	for i in range(n):
+		used = np.nonzero(ifreqs[i])[0]
+		limits.append({
+			'limit': i+1,
+			'introns': [introns[j] for j in used],
+			'probs': iprobs[i, used].tolist(),
+			'freqs': ifreqs[i, used].tolist()
+		})
+	with open(args.introns, 'w') as fp:
+		fp.write(json.dumps(limits, indent=1))
@@ -2,67 +2,34 @@ import argparse
 import os
 import gzip
 import isomod as im
-import openturns as ot 
-import csv
-import glob
+import mkmdls_lib as ml
 
 parser = argparse.ArgumentParser(description='Generates len, MM, and PWM \
 	models for apc based on sequences in the apc dataset')
-parser.add_argument('wb_dir', type=str, metavar='<directory>', 
+parser.add_argument('wb_dir', type=str, metavar='<directory>', nargs='?',
 	help='directory with apc dataset gff and fasta files')
+parser.add_argument('--genome', type=str, metavar='<file>', required=False,
+	help='genome fasta, .fai index is made if missing')
+parser.add_argument('--genome_gff', type=str, metavar='<file>', required=False,
+	help='genome-wide annotation .gff3 (or .gff3.gz), used with --genome')
 parser.add_argument('--outdir', type=str, metavar='<directory>',
 	required=False, help='output directory name')
+parser.add_argument('--counts', type=str, metavar='<file>', required=False,
+	help='raw model counts .json to update [outdir/counts.json]')
+parser.add_argument('--add', type=str, metavar='<file>', required=False,
+	help='file with gene IDs to add to stored counts')
+parser.add_argument('--remove', type=str, metavar='<file>', required=False,
+	help='file with gene IDs to remove from stored counts')
 
 args = parser.parse_args()
 
-def fdist_params(exinseqs, len_limit):
-
-	exinlens = im.get_exinbins(exinseqs)[0]
-	
-	if len_limit:
-		sample = ot.Sample([[x] for x in exinlens if x < len_limit])
-	else:
-		len_limit = max(exinlens)
-		sample = ot.Sample([[x] for x in exinlens if x < len_limit])	
-
-	distFrechet = ot.FrechetFactory().buildAsFrechet(sample)
-
-	a = distFrechet.getAlpha()
-	b = distFrechet.getBeta()
-	g = distFrechet.getGamma()
-	
-	return exinlens, a, b, g
-
-gffs = {}
-fastas = {}
-for file in os.listdir(args.wb_dir):
-	id = file.split('.')[1]
-	if file.endswith('gff3'):
-		gffs[id] = f'{args.wb_dir}{file}'
-	if file.endswith('fa'):
-		fastas[id] = f'{args.wb_dir}{file}'
-
-exons = []
-introns = []
-dons = []
-accs = []
-for gid in gffs:
-	seq = im.read_fasta(fastas[gid])
-	subseqs = im.get_subseqs(seq[1], gffs[gid])
-	for e in subseqs[0]: exons.append(e)
-	for i in subseqs[1]: introns.append(i)
-	for d in subseqs[2]: dons.append(d)
-	for a in subseqs[3]: accs.append(a)
-
-elens, ea, eb, eg = fdist_params(exons, 1000)
-ilens, ia, ib, ig = fdist_params(introns, 1000)
-
-elen_data = im.memoize_fdist(elens, ea, eb, eg, 25, 1000)
-ilen_data = im.memoize_fdist(ilens, ia, ib, ig, 35, 1000)
-emm_data = im.make_mm(exons)
-imm_data = im.make_mm(introns)
-dpwm_data = im.make_pwm(dons)
-apwm_data = im.make_pwm(accs)
+if args.genome:
+	assert args.genome_gff, '--genome needs --genome_gff'
+	assert not args.add and not args.remove, \
+		'--add/--remove need per-gene files in wb_dir'
+else:
+	assert args.wb_dir, 'wb_dir or --genome required'
+	fastas, gffs = ml.get_gene_paths(args.wb_dir)
 
 if args.outdir:
 	out = args.outdir
@@ -71,12 +38,31 @@ if args.outdir:
 else:
 	out = f'{os.getcwd()}/'
 
-im.len_write(elen_data, 'exon', outdir=out)
-im.len_write(ilen_data, 'intron', outdir=out)
-im.mm_write(emm_data, 'exon', outdir=out)
-im.mm_write(imm_data, 'intron', outdir=out)
-im.pwm_write(dpwm_data, 'donor', outdir=out)
-im.pwm_write(apwm_data, 'acceptor', outdir=out)
+counts_path = args.counts if args.counts else f'{out}counts.json'
+
+# only count the genes that changed, then renormalize/refit
+if args.genome:
+	counts = ml.count_genome(args.genome, args.genome_gff)
+elif args.add or args.remove:
+	counts = ml.counts_read(counts_path)
+	if args.add:
+		for gid in ml.read_gene_list(args.add):
+			gcounts = ml.count_gene(gid, fastas[gid], gffs[gid])
+			ml.update_counts(counts, gcounts, sign=1)
+	if args.remove:
+		for gid in ml.read_gene_list(args.remove):
+			gcounts = ml.count_gene(gid, fastas[gid], gffs[gid])
+			ml.update_counts(counts, gcounts, sign=-1)
+else:
+	counts = ml.new_counts()
+	for gid in gffs:
+		gcounts = ml.count_gene(gid, fastas[gid], gffs[gid])
+		ml.update_counts(counts, gcounts)
+
+mdls = ml.build_models(counts)
+
+ml.counts_write(counts, counts_path)
+ml.write_models(mdls, out)
 
 
 
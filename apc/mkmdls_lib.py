@@ -0,0 +1,335 @@
+import os
+import gzip
+import json
+import isomod as im
+import openturns as ot
+
+# raw counts are the sufficient statistics for every model
+# models are renormalized/refit from counts, so genes can be
+# added or removed without recounting the whole dataset
+
+alph = ['A', 'C', 'G', 'T']
+
+def get_gene_paths(wb_dir):
+
+	gffs = {}
+	fastas = {}
+	for file in os.listdir(wb_dir):
+		gid = file.split('.')[1]
+		if file.endswith('gff3'):
+			gffs[gid] = f'{wb_dir}{file}'
+		if file.endswith('fa'):
+			fastas[gid] = f'{wb_dir}{file}'
+
+	return fastas, gffs
+
+# gene lists are one ID per line, ch.N or N
+def read_gene_list(fpath):
+
+	gids = []
+	with open(fpath, 'r') as fp:
+		for line in fp.readlines():
+			line = line.rstrip()
+			if line == '' or line.startswith('#'): continue
+			if line.startswith('ch.'): line = line.split('.')[1]
+			gids.append(line)
+
+	return gids
+
+def new_counts():
+
+	return {
+		'genes': [],
+		'elen': {},
+		'ilen': {},
+		'emm': {},
+		'imm': {},
+		'dpwm': [],
+		'apwm': []
+	}
+
+##### counting #####
+
+def count_len(exinseqs, hist):
+
+	for seq in exinseqs:
+		n = str(len(seq))
+		if n not in hist: hist[n] = 0
+		hist[n] += 1
+
+	return hist
+
+# last column counts any non ACGT nt, same denominator as im.make_mm
+def count_mm(exinseqs, context, order=3):
+
+	for seq in exinseqs:
+		for i in range(len(seq)-order):
+			prev = seq[i:i+order]
+			now = seq[i+order]
+			if prev not in context: context[prev] = [0, 0, 0, 0, 0]
+			if now in alph: context[prev][alph.index(now)] += 1
+			else: context[prev][4] += 1
+
+	return context
+
+# sites with N or other non-ACGT bases are skipped
+def count_pwm(seqs, pfm):
+
+	for seq in seqs:
+		if any(nt not in alph for nt in seq): continue
+		while len(pfm) < len(seq): pfm.append([0, 0, 0, 0])
+		for j in range(len(seq)):
+			pfm[j][alph.index(seq[j])] += 1
+
+	return pfm
+
+def count_seqs(exons, introns, dons, accs, counts=None):
+
+	if counts is None: counts = new_counts()
+	count_len(exons, counts['elen'])
+	count_len(introns, counts['ilen'])
+	count_mm(exons, counts['emm'])
+	count_mm(introns, counts['imm'])
+	count_pwm(dons, counts['dpwm'])
+	count_pwm(accs, counts['apwm'])
+
+	return counts
+
+def count_gene(gid, fasta, gff):
+
+	seq = im.read_fasta(fasta)
+	exons, introns, dons, accs = im.get_subseqs(seq[1], gff)
+	counts = count_seqs(exons, introns, dons, accs)
+	counts['genes'].append(gid)
+
+	return counts
+
+##### whole genome #####
+
+# samtools faidx format: name, length, offset, bases per line, bytes per line
+def make_fai(fasta):
+
+	fai = f'{fasta}.fai'
+	with open(fasta, 'rb') as fp, open(fai, 'w') as out:
+		name = None
+		length = 0
+		offset = 0
+		lbases = 0
+		lwidth = 0
+		pos = 0
+		for line in fp:
+			if line.startswith(b'>'):
+				if name: out.write(f'{name}\t{length}\t{offset}\t{lbases}\t{lwidth}\n')
+				name = line[1:].split()[0].decode()
+				length = 0
+				offset = pos + len(line)
+				lbases = 0
+				lwidth = 0
+			else:
+				if lbases == 0:
+					lbases = len(line.rstrip())
+					lwidth = len(line)
+				length += len(line.rstrip())
+			pos += len(line)
+		if name: out.write(f'{name}\t{length}\t{offset}\t{lbases}\t{lwidth}\n')
+
+	return fai
+
+def read_fai(fai):
+
+	index = {}
+	with open(fai, 'r') as fp:
+		for line in fp.readlines():
+			line = line.rstrip().split('\t')
+			index[line[0]] = [int(x) for x in line[1:5]]
+
+	return index
+
+# 1-based inclusive coordinates, fp opened in binary mode
+def fetch_seq(fp, index, chrom, beg, end):
+
+	length, offset, lbases, lwidth = index[chrom]
+	beg = max(beg, 1)
+	end = min(end, length)
+	start = offset + ((beg-1) // lbases) * lwidth + (beg-1) % lbases
+	stop = offset + ((end-1) // lbases) * lwidth + (end-1) % lbases + 1
+	fp.seek(start)
+	seq = fp.read(stop - start).decode()
+
+	return seq.replace('\n', '').replace('\r', '').upper()
+
+def revcomp(seq):
+
+	comp = str.maketrans('ACGTN', 'TGCAN')
+	return seq.translate(comp)[::-1]
+
+# streams the genome gff, only one feature sequence is held at a time
+# donor/acceptor are the first 5/last 6 nt of each intron, as im.get_subseqs
+def count_genome(fasta, gff, source='WormBase'):
+
+	fai = f'{fasta}.fai'
+	if not os.path.exists(fai): fai = make_fai(fasta)
+	index = read_fai(fai)
+
+	counts = new_counts()
+	counts['genome'] = fasta
+	gopen = gzip.open if gff.endswith('.gz') else open
+	with gopen(gff, 'rt') as gp, open(fasta, 'rb') as fp:
+		for line in gp:
+			if line.startswith('#'): continue
+			line = line.rstrip().split('\t')
+			if len(line) < 8: continue
+			if line[1] != source: continue
+			if line[2] != 'exon' and line[2] != 'intron': continue
+			if line[0] not in index: continue
+			seq = fetch_seq(fp, index, line[0], int(line[3]), int(line[4]))
+			if line[6] == '-': seq = revcomp(seq)
+			if line[2] == 'exon':
+				count_seqs([seq], [], [], [], counts)
+			else:
+				count_seqs([], [seq], [seq[0:5]], [seq[-6:]], counts)
+
+	return counts
+
+##### updating #####
+
+def _update_hist(total, part, sign):
+
+	for k in part:
+		if k not in total: total[k] = 0
+		total[k] += sign * part[k]
+		assert total[k] >= 0, f'negative count for {k}'
+		if total[k] == 0: del total[k]
+
+def _update_mm(total, part, sign):
+
+	for ctx in part:
+		if ctx not in total: total[ctx] = [0, 0, 0, 0, 0]
+		for i in range(5):
+			total[ctx][i] += sign * part[ctx][i]
+			assert total[ctx][i] >= 0, f'negative count for {ctx}'
+		if sum(total[ctx]) == 0: del total[ctx]
+
+def _update_pwm(total, part, sign):
+
+	while len(total) < len(part): total.append([0, 0, 0, 0])
+	for j in range(len(part)):
+		for i in range(4):
+			total[j][i] += sign * part[j][i]
+			assert total[j][i] >= 0, f'negative count at position {j}'
+
+def update_counts(total, part, sign=1):
+
+	assert sign == 1 or sign == -1, 'sign must be 1 or -1'
+	for gid in part['genes']:
+		if sign == 1:
+			assert gid not in total['genes'], f'{gid} already counted'
+			total['genes'].append(gid)
+		else:
+			assert gid in total['genes'], f'{gid} not in counts'
+			total['genes'].remove(gid)
+	_update_hist(total['elen'], part['elen'], sign)
+	_update_hist(total['ilen'], part['ilen'], sign)
+	_update_mm(total['emm'], part['emm'], sign)
+	_update_mm(total['imm'], part['imm'], sign)
+	_update_pwm(total['dpwm'], part['dpwm'], sign)
+	_update_pwm(total['apwm'], part['apwm'], sign)
+
+	return total
+
+def counts_write(counts, fpath):
+
+	counts['genes'] = sorted(counts['genes'])
+	tmp = f'{fpath}.tmp'
+	with open(tmp, 'w') as fp:
+		json.dump(counts, fp)
+	os.replace(tmp, fpath)
+
+def counts_read(fpath):
+
+	with open(fpath, 'r') as fp:
+		counts = json.load(fp)
+
+	return counts
+
+##### models from counts #####
+
+def fdist_params(hist, len_limit):
+
+	# sorted, the frechet fit depends on the order of the sample
+	sizes = []
+	for n in sorted(hist, key=int):
+		for i in range(hist[n]): sizes.append(int(n))
+
+	if not len_limit: len_limit = max(sizes)
+	sample = ot.Sample([[x] for x in sizes if x < len_limit])
+
+	distFrechet = ot.FrechetFactory().buildAsFrechet(sample)
+
+	a = distFrechet.getAlpha()
+	b = distFrechet.getBeta()
+	g = distFrechet.getGamma()
+
+	return sizes, a, b, g
+
+# same output as im.make_mm on the sequences that were counted
+def mm_from_counts(context):
+
+	mm_probs = {}
+	for nts in sorted(context):
+		d = sum(context[nts])
+		mm_probs[nts] = [float(f"{x/d:.6f}") for x in context[nts][:4]]
+
+	return mm_probs
+
+# same output as im.make_pwm on the sequences that were counted
+def pwm_from_counts(pfm):
+
+	ppm = []
+	for pos in pfm:
+		total = sum(pos)
+		ppm.append({nt: f"{pos[i]/total:.6f}" for i, nt in enumerate(alph)})
+
+	return ppm
+
+def build_models(counts, elimit=1000, ilimit=1000, eminlen=25, iminlen=35):
+
+	elens, ea, eb, eg = fdist_params(counts['elen'], elimit)
+	ilens, ia, ib, ig = fdist_params(counts['ilen'], ilimit)
+
+	mdls = {
+		'elen': im.memoize_fdist(elens, ea, eb, eg, eminlen, elimit),
+		'ilen': im.memoize_fdist(ilens, ia, ib, ig, iminlen, ilimit),
+		'emm': mm_from_counts(counts['emm']),
+		'imm': mm_from_counts(counts['imm']),
+		'dpwm': pwm_from_counts(counts['dpwm']),
+		'apwm': pwm_from_counts(counts['apwm'])
+	}
+
+	return mdls
+
+def write_models(mdls, out):
+
+	im.len_write(mdls['elen'], 'exon', outdir=out)
+	im.len_write(mdls['ilen'], 'intron', outdir=out)
+	im.mm_write(mdls['emm'], 'exon', outdir=out)
+	im.mm_write(mdls['imm'], 'intron', outdir=out)
+	im.pwm_write(mdls['dpwm'], 'donor', outdir=out)
+	im.pwm_write(mdls['apwm'], 'acceptor', outdir=out)
+
+# models in the form returned by im.read_len/read_mm/read_pwm
+# lets in-memory models be scored without writing them to disk
+def score_models(mdls):
+
+	smdls = {}
+	for ft in ['elen', 'ilen']:
+		smdls[ft] = [float(x) for x in mdls[ft]]
+	for ft in ['emm', 'imm']:
+		smdls[ft] = {}
+		for ctx in mdls[ft]:
+			for i in range(len(alph)):
+				smdls[ft][ctx+alph[i]] = mdls[ft][ctx][i]
+	for ft in ['dpwm', 'apwm']:
+		smdls[ft] = [[site[nt] for nt in alph] for site in mdls[ft]]
+
+	return smdls
@@ -0,0 +1,172 @@
+import json
+import sqlite3
+import time
+
+# sqlite store for sweep and optimization results
+# genes are bare IDs ('10010' for ch.10010), a run is one sweep or ga run
+# fitness and mdist are distances, lower is better
+# fitness icost is in apc_isogen.py units, isomod multiplies it by 100
+# genalgiso.py icosts (apc_model_lib, not multiplied) are stored divided by 100
+
+wts = ['wdpwm', 'wapwm', 'wemm', 'wimm', 'welen', 'wilen', 'icost']
+
+def connect(db):
+
+	conn = sqlite3.connect(db)
+	c = conn.cursor()
+	c.execute("""CREATE TABLE IF NOT EXISTS genes (
+		gid TEXT PRIMARY KEY
+	)""")
+	c.execute("""CREATE TABLE IF NOT EXISTS runs (
+		run_id INTEGER PRIMARY KEY,
+		kind TEXT,
+		created TEXT
+	)""")
+	c.execute("""CREATE TABLE IF NOT EXISTS params (
+		run_id INTEGER,
+		name TEXT,
+		value TEXT
+	)""")
+	c.execute(f"""CREATE TABLE IF NOT EXISTS fitness (
+		run_id INTEGER,
+		gid TEXT,
+		fit REAL,
+		{', '.join(w + ' REAL' for w in wts)}
+	)""")
+	c.execute("""CREATE TABLE IF NOT EXISTS mdists (
+		run_id INTEGER,
+		gid TEXT,
+		icost REAL,
+		mdist REAL,
+		isonum INTEGER
+	)""")
+	c.execute("CREATE INDEX IF NOT EXISTS fitness_gid ON fitness (gid, fit)")
+	c.execute("""CREATE INDEX IF NOT EXISTS fitness_run_gid
+		ON fitness (run_id, gid, fit)""")
+	c.execute("CREATE INDEX IF NOT EXISTS fitness_run ON fitness (run_id)")
+	c.execute("CREATE INDEX IF NOT EXISTS mdists_run ON mdists (run_id, icost)")
+	c.execute("CREATE INDEX IF NOT EXISTS mdists_gid ON mdists (gid)")
+	c.execute("CREATE INDEX IF NOT EXISTS params_run ON params (run_id)")
+	conn.commit()
+
+	return conn
+
+# params is a dict, values are stored as json
+def add_run(conn, kind, params):
+
+	c = conn.cursor()
+	c.execute("INSERT INTO runs (kind, created) VALUES (?,?)",
+		(kind, time.strftime('%Y-%m-%d %H:%M:%S')))
+	run_id = c.lastrowid
+	c.executemany("INSERT INTO params VALUES (?,?,?)",
+		[(run_id, k, json.dumps(params[k])) for k in params])
+	conn.commit()
+
+	return run_id
+
+def add_genes(conn, gids):
+
+	c = conn.cursor()
+	c.executemany("INSERT OR IGNORE INTO genes VALUES (?)",
+		[(gid,) for gid in gids])
+	conn.commit()
+
+# rows are (gid, fit, wdpwm, wapwm, wemm, wimm, welen, wilen, icost)
+def add_fitness(conn, run_id, rows):
+
+	rows = [(run_id,) + tuple(row) for row in rows]
+	add_genes(conn, {row[1] for row in rows})
+	c = conn.cursor()
+	c.executemany(f"INSERT INTO fitness VALUES ({','.join('?'*(3+len(wts)))})",
+		rows)
+	conn.commit()
+
+# rows are (gid, icost, mdist, isonum)
+def add_mdists(conn, run_id, rows):
+
+	rows = [(run_id,) + tuple(row) for row in rows]
+	add_genes(conn, {row[1] for row in rows})
+	c = conn.cursor()
+	c.executemany("INSERT INTO mdists VALUES (?,?,?,?,?)", rows)
+	conn.commit()
+
+##### importing #####
+
+# data/1045weights.txt: fit, wdpwm, wapwm, wemm, wimm, welen, wilen, icost, ch.ID
+def read_weights_txt(wfile):
+
+	rows = []
+	with open(wfile, 'r') as fp:
+		for line in fp.readlines():
+			line = line.rstrip()
+			if line == '': continue
+			line = line.split('\t')
+			gid = line[8].split('.')[1]
+			rows.append([gid] + [float(x) for x in line[:8]])
+
+	return rows
+
+def import_weights(conn, wfile):
+
+	run_id = add_run(conn, 'weights', {'file': wfile})
+	add_fitness(conn, run_id, read_weights_txt(wfile))
+
+	return run_id
+
+# results_icost.json from icost_scoring.py
+def import_icost(conn, jfile, params=None):
+
+	with open(jfile, 'r') as fp:
+		icost_groups = json.load(fp)
+	rows = []
+	for icost, infos in icost_groups:
+		for info in infos:
+			rows.append((info['ID'], icost, info['mdist'][0], info['mdist'][1]))
+	if params is None: params = {'file': jfile}
+	run_id = add_run(conn, 'icost', params)
+	add_mdists(conn, run_id, rows)
+
+	return run_id
+
+##### queries #####
+
+def latest_run(conn, kind):
+
+	c = conn.cursor()
+	c.execute("SELECT max(run_id) FROM runs WHERE kind = (?)", (kind,))
+
+	return c.fetchone()[0]
+
+# latest weights or ga run, the default for --weights <.db>
+def latest_fitness_run(conn):
+
+	c = conn.cursor()
+	c.execute("SELECT max(run_id) FROM fitness")
+
+	return c.fetchone()[0]
+
+# lowest fit per gene of one run, same dict as the weights files were read into
+# runs are never mixed, their fitness and weights are not comparable
+def best_weights(conn, run_id):
+
+	c = conn.cursor()
+	c.execute(f"""SELECT f.gid, f.fit, {', '.join('f.' + w for w in wts)}
+		FROM fitness f WHERE f.run_id = (?) AND f.rowid = (
+			SELECT rowid FROM fitness WHERE run_id = f.run_id AND gid = f.gid
+			ORDER BY fit LIMIT 1)""", (run_id,))
+	best = {}
+	for row in c.fetchall():
+		best[row[0]] = {'fit': row[1]}
+		for w, v in zip(wts, row[2:]):
+			best[row[0]][w] = v
+
+	return best
+
+# (icost, average mdist, genes) sorted by icost
+def avg_mdists(conn, run_id):
+
+	c = conn.cursor()
+	c.execute("""SELECT icost, avg(mdist), count(*) FROM mdists
+		WHERE run_id = (?) GROUP BY icost ORDER BY icost""", (run_id,))
+
+	return c.fetchall()
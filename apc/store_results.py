@@ -0,0 +1,23 @@
+import argparse
+import results_lib as rl
+
+parser = argparse.ArgumentParser(
+	description='import weight and icost results into a sqlite .db')
+parser.add_argument('db', type=str, metavar='<file>',
+	help='results .db, created if missing')
+parser.add_argument('--weights', required=False, type=str, metavar='<file>',
+	help='per-gene weights .txt, as data/1045weights.txt')
+parser.add_argument('--icost', required=False, type=str, metavar='<file>',
+	help='results_icost.json from icost_scoring.py')
+
+args = parser.parse_args()
+
+conn = rl.connect(args.db)
+if args.weights:
+	run_id = rl.import_weights(conn, args.weights)
+	print('weights run:', run_id, 'genes:', len(rl.best_weights(conn, run_id)))
+if args.icost:
+	run_id = rl.import_icost(conn, args.icost)
+	for icost, avg, n in rl.avg_mdists(conn, run_id):
+		print('icost:', icost, 'avg mdist:', avg, 'genes:', n)
+conn.close()
@@ -1,12 +1,15 @@
 import argparse
 import os
+import results_lib as rl
 
 parser = argparse.ArgumentParser(description=
 	'writes file with command line arguments to be used in parallize')
 parser.add_argument('apc_dir', type=str, metavar='<str>', 
 	help='directory with apc fasta and gff files')
 parser.add_argument('--weights', required=False, type=str, metavar='<str>',
-	help='file with individual weights for each gene')
+	help='file with individual weights for each gene, or a results .db')
+parser.add_argument('--run', required=False, type=int, metavar='<int>',
+	help='--weights .db: run to take the weights from, default the latest')
 parser.add_argument('--read_gff', action='store_true', 
 	help='get don/acc sites from gff files in apc dir')
 parser.add_argument('--outfile', required=True, type=str, metavar='<str>', 
@@ -56,7 +59,12 @@ for fpath in sorted(apc_list):
 	else:
 		fa_gff_pairs[ID] += [fpath]
 
-if args.weights:
+if args.weights and args.weights.endswith('.db'):
+	conn = rl.connect(args.weights)
+	run_id = args.run if args.run else rl.latest_fitness_run(conn)
+	ftwts = {f'ch.{gid}': w for gid, w in rl.best_weights(conn, run_id).items()}
+	conn.close()
+elif args.weights:
 	ftwts = {}
 	with open(args.weights, 'r') as fp:
 		for line in fp.readlines():
@@ -1,7 +1,7 @@
-import copy
 import gzip
 import itertools
 import math
+import numpy as np
 import random
 import sys
 
@@ -143,11 +143,11 @@ def create_len(seqs, floor, limit):
 		count[n] += 1
 
 	# rectangular smoothing
+	# lengths within r of either end are not spread, as in isoform.create_len
 	r = 5 # 5 on each side
 	smooth = [0 for i in range(len(count))]
-	for i in range(r, len(count) -r):
-		for j in range(-r, r+1):
-			smooth[i+j] += count[i]
+	if len(count) > 2*r:
+		smooth = np.convolve(count[r:len(count)-r], np.ones(2*r + 1)).tolist()
 
 	for i in range(floor):
 		smooth[i] = 0
@@ -479,8 +479,8 @@ def get_introns(gff):
 def expdiff(introns1, introns2):
 
 	# non-mutating
-	i1 = copy.deepcopy(introns1)
-	i2 = copy.deepcopy(introns2)
+	i1 = dict(introns1)
+	i2 = dict(introns2)
 
 	# ensure all introns are in both collections
 	for k in i1:
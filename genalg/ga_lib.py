@@ -0,0 +1,626 @@
+import math
+import random
+import signal
+from collections import OrderedDict
+from multiprocessing import shared_memory
+import numpy as np
+import apc_model_lib as aml
+import icost_lib as icl
+import refdist_lib as rdl
+
+# in-process fitness for weight/icost optimization
+# a gene's isoforms are enumerated and scored once per model into a
+# feature matrix, so a genotype's isoform scores are one matrix product
+#
+# isoform score = features @ weights - introns * icost
+# fitness = Manhattan distance between the intron distribution of the
+# top --limit isoforms and the WormBase introns, lower is better
+
+# same order as the weights files and results_lib.wts
+wts = ['wdpwm', 'wapwm', 'wemm', 'wimm', 'welen', 'wilen', 'icost']
+
+# per-isoform model scores, columns follow wts[:6]
+# same model calls as icost_lib.get_base_scores
+def get_features(apc_isoforms, seq, mdls):
+
+	ea, eb, eg = mdls['elen_params']
+	ia, ib, ig = mdls['ilen_params']
+	exon_scores = {}
+	intron_scores = {}
+	features = np.zeros((len(apc_isoforms), 6))
+	for k, iso in enumerate(apc_isoforms):
+		for exon in iso['exons']:
+			if exon not in exon_scores:
+				emm = aml.get_exin_mm_score(exon, seq, mdls['emm'])
+				elen = aml.get_exin_len_score(exon, mdls['elen'], ea, eb, eg)
+				exon_scores[exon] = [0, 0, emm, 0, elen, 0]
+			features[k] += exon_scores[exon]
+		for intron in iso['introns']:
+			if intron not in intron_scores:
+				dseq, aseq = aml.get_donacc_seq(intron, seq)
+				dpwm = aml.get_donacc_pwm_score(dseq, mdls['dpwm'])
+				apwm = aml.get_donacc_pwm_score(aseq, mdls['apwm'])
+				imm = aml.get_exin_mm_score(intron, seq, mdls['imm'],
+					'GT', 'AG')
+				ilen = aml.get_exin_len_score(intron, mdls['ilen'],
+					ia, ib, ig)
+				intron_scores[intron] = [dpwm, apwm, 0, imm, 0, ilen]
+			features[k] += intron_scores[intron]
+
+	return features
+
+# everything fitness() needs for one gene, introns are 1-based like gffs
+def prep_gene(fasta, gff, mdls, maxs=3, minin=25, minex=25, flank=100,
+		limit=100, bli=True):
+
+	seqid, seq = icl.read_seq(fasta)
+	if bli: dons, accs = aml.read_gff_sites(seq, gff)
+	else:   dons, accs = aml.get_gtag(seq)
+	apc_isoforms, trials = aml.apc(dons, accs, maxs, minin, minex, flank, seq)
+
+	index = {}
+	for iso in apc_isoforms:
+		for intron in iso['introns']:
+			intron = (intron[0]+1, intron[1]+1)
+			if intron not in index: index[intron] = len(index)
+	incidence = np.zeros((len(apc_isoforms), len(index)))
+	for k, iso in enumerate(apc_isoforms):
+		for intron in iso['introns']:
+			incidence[k, index[(intron[0]+1, intron[1]+1)]] = 1
+
+	ref, ref_only, isonum = rdl.align_ref(rdl.get_ref(gff), list(index))
+
+	return {
+		'features': get_features(apc_isoforms, seq, mdls),
+		'nints': incidence.sum(axis=1),
+		'incidence': incidence,
+		'ref': ref,
+		'ref_only': ref_only,
+		'limit': limit
+	}
+
+def genotype_matrix(pop):
+	return np.array([[guy['genotype'][w] for w in wts] for guy in pop])
+
+# fitness of every row of genotypes (genotypes x wts)
+def fitness(gene, genotypes):
+
+	g = np.atleast_2d(np.asarray(genotypes, dtype=float))
+	if len(gene['features']) == 0:
+		return np.full(len(g), gene['ref_only'])
+	scores = g[:, :6] @ gene['features'].T - g[:, 6:7] * gene['nints']
+
+	# only the top limit isoforms of each genotype are kept
+	keep = np.ones(scores.shape, dtype=bool)
+	limit = gene['limit']
+	if limit and limit < scores.shape[1]:
+		top = np.argpartition(-scores, limit-1, axis=1)[:, :limit]
+		keep[:] = False
+		np.put_along_axis(keep, top, True, axis=1)
+
+	scores = np.where(keep, scores, -np.inf)
+	scores -= scores.max(axis=1, keepdims=True)
+	probs = np.exp2(scores)
+	probs /= probs.sum(axis=1, keepdims=True)
+	mass = probs @ gene['incidence']
+	iprobs = mass / mass.sum(axis=1, keepdims=True)
+
+	return np.abs(iprobs - gene['ref']).sum(axis=1) + gene['ref_only']
+
+##### genetic algorithm #####
+
+def random_guy():
+
+	guy = {'genotype': {}, 'fitness': None}
+	for w in wts[:6]: guy['genotype'][w] = random.random()
+	guy['genotype']['icost'] = random.randint(0, 100)
+
+	return guy
+
+# same operators as optiso, weights are kept at 0 or more
+def mate(p1, p2, mut):
+
+	child = {'genotype': {}, 'fitness': None}
+	for w in wts[:6]:
+		if random.random() < 0.5: child['genotype'][w] = p1['genotype'][w]
+		else:                     child['genotype'][w] = p2['genotype'][w]
+		if random.random() < mut:
+			child['genotype'][w] += 0.5 - random.random()
+			child['genotype'][w] = max(child['genotype'][w], 0)
+
+	if random.random() < 0.5:
+		child['genotype']['icost'] = p1['genotype']['icost']
+	else:
+		child['genotype']['icost'] = p2['genotype']['icost']
+	if random.random() < mut:
+		child['genotype']['icost'] = random.randint(0, 100)
+
+	return child
+
+# evaluate(guys) returns their fitness values, the whole list at once
+def evaluate_pop(guys, evaluate):
+
+	for guy, fit in zip(guys, evaluate(guys)):
+		guy['fitness'] = float(fit)
+
+# yields (generation, population sorted by fitness) after every generation
+def evolve(pop, gens, die, mut, evaluate, start=0):
+
+	todo = [guy for guy in pop if guy['fitness'] is None]
+	if todo: evaluate_pop(todo, evaluate)
+
+	half = int(len(pop) * die)
+	for g in range(start, gens):
+		pop = sorted(pop, key=lambda guy: guy['fitness'])
+
+		# the best half survives, the rest are replaced by children
+		children = []
+		for i in range(len(pop) - half, len(pop)):
+			p1 = random.randint(0, len(pop) - half - 1)
+			p2 = random.randint(0, len(pop) - half - 1)
+			pop[i] = mate(pop[p1], pop[p2], mut)
+			children.append(pop[i])
+		evaluate_pop(children, evaluate)
+
+		yield g, sorted(pop, key=lambda guy: guy['fitness'])
+
+##### shared memory #####
+
+# many genes are packed into a few flat arrays in shared memory
+# pool workers attach to them by name, nothing is pickled per call
+# incidence matrices are stored flattened, each gene has its own shape
+
+def pack_genes(genes):
+
+	arrays = {
+		'features': np.concatenate([g['features'] for g in genes]),
+		'nints': np.concatenate([g['nints'] for g in genes]),
+		'incidence': np.concatenate([g['incidence'].ravel() for g in genes]),
+		'ref': np.concatenate([g['ref'] for g in genes]),
+		'ref_only': np.array([g['ref_only'] for g in genes]),
+		'limit': np.array([g['limit'] or 0 for g in genes]),
+		'shape': np.array([g['incidence'].shape for g in genes])
+	}
+
+	return arrays
+
+def unpack_genes(arrays):
+
+	genes = []
+	iso = 0
+	inc = 0
+	intr = 0
+	for k, (n, m) in enumerate(arrays['shape']):
+		genes.append({
+			'features': arrays['features'][iso:iso+n],
+			'nints': arrays['nints'][iso:iso+n],
+			'incidence': arrays['incidence'][inc:inc+n*m].reshape(n, m),
+			'ref': arrays['ref'][intr:intr+m],
+			'ref_only': float(arrays['ref_only'][k]),
+			'limit': int(arrays['limit'][k])
+		})
+		iso += n
+		inc += n * m
+		intr += m
+
+	return genes
+
+# returns the shared memory blocks, to close/unlink, and what workers need
+def share_genes(genes):
+
+	blocks = []
+	meta = {}
+	try:
+		for name, a in pack_genes(genes).items():
+			a = np.ascontiguousarray(a)
+			shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+			blocks.append(shm)
+			np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+			meta[name] = (shm.name, a.shape, a.dtype.str)
+	except BaseException:
+		free_genes(blocks)
+		raise
+
+	return blocks, meta
+
+def free_genes(blocks):
+
+	for shm in blocks:
+		shm.close()
+		shm.unlink()
+
+_shared = {'blocks': [], 'genes': None}
+
+# pool initializer
+def attach_genes(meta):
+
+	# ctrl-c is handled by the parent, which terminates the pool
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	arrays = {}
+	for name, (shm_name, shape, dtype) in meta.items():
+		shm = shared_memory.SharedMemory(name=shm_name)
+		_shared['blocks'].append(shm)
+		arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+	_shared['genes'] = unpack_genes(arrays)
+
+# (genotypes x genes) fitness of a population slice, runs in a worker
+def shared_fitness(genotypes):
+	return np.stack([fitness(g, genotypes) for g in _shared['genes']], axis=1)
+
+# population rows are split into one slice per worker
+def pool_fitness(pool, cpus, genotypes):
+
+	slices = [s for s in np.array_split(genotypes, cpus) if len(s) > 0]
+
+	return np.concatenate(pool.map(shared_fitness, slices))
+
+##### gradient #####
+
+# smooth surrogates of fitness() and their exact gradients
+# all isoforms are used, the top --limit cut is not differentiable
+# p = softmax2(scores), q = intron marginals of p, r = reference
+#	sq: sum (q - r)**2
+#	kl: sum r * log(r / q)
+# rows of genotypes are optimized independently
+
+def loss_grad(gene, genotypes, loss='kl', eps=1e-9):
+
+	g = np.atleast_2d(np.asarray(genotypes, dtype=float))
+	F = gene['features']
+	M = gene['incidence']
+	n = gene['nints']
+	r = gene['ref']
+	if len(F) == 0: return np.zeros(len(g)), np.zeros(g.shape)
+
+	scores = g[:, :6] @ F.T - g[:, 6:7] * n
+	scores -= scores.max(axis=1, keepdims=True)
+	p = np.exp2(scores)
+	p /= p.sum(axis=1, keepdims=True)
+	T = p @ n
+	q = (p @ M) / T[:, None]
+
+	if loss == 'sq':
+		L = ((q - r) ** 2).sum(axis=1)
+		dq = 2 * (q - r)
+	else:
+		L = (r * (np.log(r + eps) - np.log(q + eps))).sum(axis=1)
+		dq = -r / (q + eps)
+
+	# q = p @ M / p @ n, then the softmax, then scores = F @ w - n * icost
+	dp = (dq @ M.T - n * (q * dq).sum(axis=1, keepdims=True)) / T[:, None]
+	ds = np.log(2) * p * (dp - (p * dp).sum(axis=1, keepdims=True))
+	grad = np.concatenate([ds @ F, -(ds @ n)[:, None]], axis=1)
+
+	return L, grad
+
+# Adam on loss_grad, weights and icost are kept at 0 or more
+# icost moves scale times faster than the weights, it has a larger range
+# returns the genotypes with the best fitness() seen and that fitness
+def grad_descent(loss_grad_fn, fitness_fn, start, steps=200, lr=0.05,
+		scale=10, b1=0.9, b2=0.999, eps=1e-8):
+
+	x = np.atleast_2d(np.asarray(start, dtype=float)).copy()
+	step = np.full(x.shape[1], lr)
+	step[6] *= scale
+	m = np.zeros(x.shape)
+	v = np.zeros(x.shape)
+	best = x.copy()
+	best_fit = fitness_fn(x)
+	for t in range(1, steps+1):
+		L, grad = loss_grad_fn(x)
+		m = b1 * m + (1 - b1) * grad
+		v = b2 * v + (1 - b2) * grad ** 2
+		mh = m / (1 - b1 ** t)
+		vh = v / (1 - b2 ** t)
+		x = np.maximum(x - step * mh / (np.sqrt(vh) + eps), 0)
+		fit = fitness_fn(x)
+		better = fit < best_fit
+		best[better] = x[better]
+		best_fit = np.where(better, fit, best_fit)
+
+	return best, best_fit
+
+# one shared genotype per row for all genes, fitted on minibatches of genes
+# each step averages loss_grad over batch random genes, the mean fitness()
+# over all genes is checked every check steps and the best is kept
+# fitness_fn, e.g. a cached one, replaces that mean if given
+def minibatch_descent(genes, start, batch=32, steps=1000, loss='kl', lr=0.05,
+		scale=10, check=50, seed=None, b1=0.9, b2=0.999, eps=1e-8,
+		fitness_fn=None):
+
+	rng = np.random.default_rng(seed)
+	batch = min(batch, len(genes))
+
+	def mean_fitness(x):
+		return np.mean([fitness(gene, x) for gene in genes], axis=0)
+	if fitness_fn is None: fitness_fn = mean_fitness
+
+	x = np.atleast_2d(np.asarray(start, dtype=float)).copy()
+	step = np.full(x.shape[1], lr)
+	step[6] *= scale
+	m = np.zeros(x.shape)
+	v = np.zeros(x.shape)
+	best = x.copy()
+	best_fit = fitness_fn(x)
+	for t in range(1, steps+1):
+		grad = 0
+		for k in rng.choice(len(genes), batch, replace=False):
+			grad += loss_grad(genes[k], x, loss)[1] / batch
+		m = b1 * m + (1 - b1) * grad
+		v = b2 * v + (1 - b2) * grad ** 2
+		mh = m / (1 - b1 ** t)
+		vh = v / (1 - b2 ** t)
+		x = np.maximum(x - step * mh / (np.sqrt(vh) + eps), 0)
+		if t % check == 0 or t == steps:
+			fit = fitness_fn(x)
+			better = fit < best_fit
+			best[better] = x[better]
+			best_fit = np.where(better, fit, best_fit)
+
+	return best, best_fit
+
+##### cma-es and differential evolution #####
+
+# both search the unit cube, genotypes are x * upper
+# fitness_fn takes a (genotypes x wts) array and returns their fitness,
+# one call per generation, so a pool in fitness_fn evaluates in parallel
+# each generation yields {'gen', 'pop', 'fits', 'best', 'best_fit', 'evals'}
+# and both stop when budget evaluations are used
+
+upper = np.array([5, 5, 5, 5, 5, 5, 100], dtype=float)
+
+def cmaes(fitness_fn, upper=upper, pop=None, budget=2000, sigma=0.3,
+		seed=None):
+
+	rng = np.random.default_rng(seed)
+	n = len(upper)
+	lam = pop if pop else 4 + int(3 * np.log(n))
+	mu = lam // 2
+	w = np.log(mu + 0.5) - np.log(np.arange(1, mu+1))
+	w /= w.sum()
+	mueff = 1 / (w ** 2).sum()
+
+	cc = (4 + mueff/n) / (n + 4 + 2*mueff/n)
+	cs = (mueff + 2) / (n + mueff + 5)
+	c1 = 2 / ((n + 1.3) ** 2 + mueff)
+	cmu = min(1 - c1, 2 * (mueff - 2 + 1/mueff) / ((n + 2) ** 2 + mueff))
+	damps = 1 + 2 * max(0, np.sqrt((mueff - 1) / (n + 1)) - 1) + cs
+	chin = np.sqrt(n) * (1 - 1/(4*n) + 1/(21*n*n))
+
+	m = rng.random(n)
+	pc = np.zeros(n)
+	ps = np.zeros(n)
+	C = np.eye(n)
+	best, best_fit = None, np.inf
+	evals = 0
+	g = 0
+	while evals + lam <= budget:
+		D2, B = np.linalg.eigh(C)
+		D = np.sqrt(np.maximum(D2, 1e-20))
+		y = rng.standard_normal((lam, n)) * D @ B.T
+		x = m + sigma * y
+
+		# out of the cube is evaluated on the edge plus a penalty
+		xc = np.clip(x, 0, 1)
+		fits = np.asarray(fitness_fn(xc * upper), dtype=float)
+		evals += lam
+		order = np.argsort(fits + ((x - xc) ** 2).sum(axis=1))
+		if fits[order[0]] < best_fit:
+			best, best_fit = xc[order[0]] * upper, fits[order[0]]
+
+		old = m
+		m = w @ x[order[:mu]]
+		invsqrt = B @ np.diag(1 / D) @ B.T
+		ps = (1 - cs) * ps + np.sqrt(cs * (2 - cs) * mueff) \
+			* invsqrt @ (m - old) / sigma
+		hsig = np.linalg.norm(ps) / np.sqrt(1 - (1 - cs) ** (2 * (g + 1))) \
+			/ chin < 1.4 + 2 / (n + 1)
+		pc = (1 - cc) * pc + hsig * np.sqrt(cc * (2 - cc) * mueff) \
+			* (m - old) / sigma
+		art = (x[order[:mu]] - old) / sigma
+		C = (1 - c1 - cmu) * C \
+			+ c1 * (np.outer(pc, pc) + (1 - hsig) * cc * (2 - cc) * C) \
+			+ cmu * art.T @ np.diag(w) @ art
+		C = (C + C.T) / 2
+		sigma *= np.exp((cs / damps) * (np.linalg.norm(ps) / chin - 1))
+
+		yield {'gen': g, 'pop': xc * upper, 'fits': fits, 'best': best,
+			'best_fit': best_fit, 'evals': evals}
+		g += 1
+
+# rand/1/bin
+def diff_evo(fitness_fn, upper=upper, pop=None, budget=2000, f=0.8, cr=0.9,
+		seed=None):
+
+	rng = np.random.default_rng(seed)
+	n = len(upper)
+	npop = pop if pop else 10 * n
+	x = rng.random((npop, n))
+	fits = np.asarray(fitness_fn(x * upper), dtype=float)
+	evals = npop
+	g = 0
+	while evals + npop <= budget:
+		trials = x.copy()
+		for i in range(npop):
+			a, b, c = rng.choice([j for j in range(npop) if j != i], 3,
+				replace=False)
+			mutant = np.clip(x[a] + f * (x[b] - x[c]), 0, 1)
+			cross = rng.random(n) < cr
+			cross[rng.integers(n)] = True
+			trials[i, cross] = mutant[cross]
+		tfits = np.asarray(fitness_fn(trials * upper), dtype=float)
+		evals += npop
+		better = tfits <= fits
+		x[better] = trials[better]
+		fits[better] = tfits[better]
+
+		i = int(np.argmin(fits))
+		yield {'gen': g, 'pop': x * upper, 'fits': fits.copy(),
+			'best': x[i] * upper, 'best_fit': fits[i], 'evals': evals}
+		g += 1
+
+##### bayesian optimization #####
+
+# gaussian process with an rbf kernel on the unit cube, fitness is
+# standardized and the length scale is the best marginal likelihood of a grid
+# each round proposes batch points by expected improvement, one at a time,
+# with the earlier proposals of the round added at their predicted mean
+
+def rbf(A, B, ls):
+
+	d2 = ((A[:, None, :] - B[None, :, :]) ** 2).sum(axis=2)
+	return np.exp(-d2 / (2 * ls * ls))
+
+def gp_fit(X, y, ls=None, noise=1e-4):
+
+	if ls is None:
+		gps = [gp_fit(X, y, ls, noise) for ls in (0.05, 0.1, 0.2, 0.3, 0.5, 1, 2)]
+		return max(gps, key=lambda gp: gp['loglik'])
+
+	mu = y.mean()
+	sd = y.std() if y.std() > 0 else 1
+	yn = (y - mu) / sd
+	L = np.linalg.cholesky(rbf(X, X, ls) + noise * np.eye(len(X)))
+	alpha = np.linalg.solve(L.T, np.linalg.solve(L, yn))
+
+	return {
+		'X': X, 'L': L, 'alpha': alpha, 'ls': ls, 'mu': mu, 'sd': sd,
+		'loglik': -0.5 * yn @ alpha - np.log(np.diag(L)).sum()
+	}
+
+def gp_predict(gp, Xs):
+
+	Ks = rbf(Xs, gp['X'], gp['ls'])
+	m = Ks @ gp['alpha'] * gp['sd'] + gp['mu']
+	v = np.linalg.solve(gp['L'], Ks.T)
+	var = np.maximum(1 - (v ** 2).sum(axis=0), 1e-12)
+
+	return m, np.sqrt(var) * gp['sd']
+
+_erf = np.vectorize(math.erf)
+
+# fitness is minimized
+def expected_improvement(m, s, best):
+
+	z = (best - m) / s
+	cdf = 0.5 * (1 + _erf(z / np.sqrt(2)))
+	pdf = np.exp(-z * z / 2) / np.sqrt(2 * np.pi)
+
+	return (best - m) * cdf + s * pdf
+
+# random points and small steps around the best points so far
+def bo_candidates(rng, X, y, n):
+
+	top = X[np.argsort(y)[:5]]
+	near = top[rng.integers(len(top), size=n // 2)] \
+		+ rng.normal(0, 0.05, (n // 2, X.shape[1]))
+
+	return np.clip(np.vstack([rng.random((n - n // 2, X.shape[1])), near]), 0, 1)
+
+def bayes_opt(fitness_fn, upper=upper, batch=1, budget=100, init=None,
+		cands=2000, seed=None):
+
+	rng = np.random.default_rng(seed)
+	n = len(upper)
+	init = min(init if init else 2 * n + 2, budget)
+
+	# latin hypercube start
+	X = (rng.permuted(np.tile(np.arange(init), (n, 1)), axis=1).T
+		+ rng.random((init, n))) / init
+	y = np.asarray(fitness_fn(X * upper), dtype=float)
+	g = 0
+	while len(y) < budget:
+		q = min(batch, budget - len(y))
+		gp = gp_fit(X, y)
+		Xq, yq = X, y
+		props = []
+		for i in range(q):
+			C = bo_candidates(rng, X, y, cands)
+			m, sd = gp_predict(gp, C)
+			x = C[np.argmax(expected_improvement(m, sd, y.min()))]
+			props.append(x)
+			if i == q - 1: break
+			Xq = np.vstack([Xq, x])
+			yq = np.append(yq, gp_predict(gp, x[None])[0])
+			gp = gp_fit(Xq, yq, gp['ls'])
+		P = np.array(props)
+		fits = np.asarray(fitness_fn(P * upper), dtype=float)
+		X = np.vstack([X, P])
+		y = np.append(y, fits)
+
+		i = int(np.argmin(y))
+		yield {'gen': g, 'pop': P * upper, 'fits': fits, 'best': X[i] * upper,
+			'best_fit': y[i], 'evals': len(y)}
+		g += 1
+
+##### convergence #####
+
+# diversity is the mean standard deviation of the genotypes scaled by upper
+def diagnostics(genotypes, fits, upper=upper):
+
+	fits = np.asarray(fits, dtype=float)
+	return {
+		'best': float(fits.min()),
+		'mean': float(fits.mean()),
+		'diversity': float((np.asarray(genotypes) / upper).std(axis=0).mean())
+	}
+
+# true when the best fitness improved by less than tol in patience generations
+def plateau(bests, patience, tol):
+
+	if patience <= 0 or len(bests) <= patience: return False
+	return bests[-patience-1] - min(bests[-patience:]) < tol
+
+##### fitness cache #####
+
+# genotypes are rounded to digits, so near-identical genotypes share an entry
+# the least recently used entries are dropped above maxsize
+
+def new_cache(maxsize=100000, digits=6):
+
+	return {
+		'data': OrderedDict(),
+		'maxsize': maxsize,
+		'digits': digits,
+		'hits': 0,
+		'misses': 0
+	}
+
+# fitness_fn(genotypes) is only called for rows that are not cached
+def cached_fitness(cache, gid, genotypes, fitness_fn):
+
+	g = np.atleast_2d(np.asarray(genotypes, dtype=float))
+	keys = [(gid,) + tuple(row) for row in np.round(g, cache['digits'])]
+	fits = np.zeros(len(g))
+	todo = {}
+	for i, key in enumerate(keys):
+		if key in cache['data']:
+			cache['data'].move_to_end(key)
+			fits[i] = cache['data'][key]
+			cache['hits'] += 1
+		elif key in todo:
+			todo[key].append(i)
+			cache['hits'] += 1
+		else:
+			todo[key] = [i]
+			cache['misses'] += 1
+
+	if todo:
+		new = fitness_fn(g[[rows[0] for rows in todo.values()]])
+		for (key, rows), fit in zip(todo.items(), new):
+			fits[rows] = fit
+			cache['data'][key] = float(fit)
+		while len(cache['data']) > cache['maxsize']:
+			cache['data'].popitem(last=False)
+
+	return fits
+
+def cache_stats(cache):
+
+	total = cache['hits'] + cache['misses']
+	return {
+		'hits': cache['hits'],
+		'misses': cache['misses'],
+		'hit_rate': cache['hits'] / total if total else 0,
+		'size': len(cache['data'])
+	}
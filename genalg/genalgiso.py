@@ -1,19 +1,29 @@
 import argparse
+import multiprocessing as mp
+import json
 import random
+import sys
+import time
+import numpy as np
 from datetime import datetime
-import apc_model_lib as aml
-import mdist_lib as mdl
+import icost_lib as icl
+import ga_lib as gal
+import results_lib as rl
 import os
 
 parser = argparse.ArgumentParser(
 	description='genetic algorithm for weight and icost optimization')
-parser.add_argument('fasta', type=str, metavar='<file>',
+parser.add_argument('fasta', type=str, metavar='<file>', nargs='?',
 	help='single gene fasta file')
-parser.add_argument('gff', type=str, metavar='<file>',
+parser.add_argument('gff', type=str, metavar='<file>', nargs='?',
 	help='single gene gff file')
-parser.add_argument('--program', required=False, type=str, 
-	default='../apc/apc_isogen.py', metavar='<exec>', 
-	help='path to apc program [%(default)s]')
+parser.add_argument('--apc_dir', required=False, type=str,
+	metavar='<directory>', help='optimize one genotype for every gene in the'
+	' directory, fitness is the mean over genes')
+parser.add_argument('--cpus', required=False, type=int, default=1,
+	metavar='<int>', help='--apc_dir: CPUs for fitness [%(default)i]')
+parser.add_argument('--gtag', action='store_true',
+	help='use all GT/AG sites, not the sites in the gff')
 
 parser.add_argument('--max_splice', required=False, type=int, default=3,
 	metavar='<int>', help='maximum number of splicing events %(default)d')
@@ -44,8 +54,6 @@ parser.add_argument('--dpwm', required=False, type=str,
 parser.add_argument('--apwm', required=False, type=str, 
 	default='../mkmdls_out/acceptor_pwm.tsv', metavar='<file>',
 	help='path to acceptor pwm .tsv [%(default)s]')
-parser.add_argument('--icost', required=False, type=float, default=0.0,
-	metavar='<float>', help='intron cost %(default).2d')
 	
 parser.add_argument('--pop', required=False, type=int, default=50,
 	metavar='<int>', help='population size [%(default)i]')
@@ -53,111 +61,286 @@ parser.add_argument('--gen', required=False, type=int, default=50,
 	metavar='<int>', help='number of generations [%(default)i]')
 parser.add_argument('--die', required=False, type=float, default=0.5,
 	metavar='<float>', help='fraction tha die each generation [%(default).2f]')
+parser.add_argument('--mut', required=False, type=float, default=0.1,
+	metavar='<float>', help='mutation frequency [%(default).2f]')
+parser.add_argument('--seed', required=False, type=int,
+	metavar='<int>', help='random seed')
+parser.add_argument('--verbose', action='store_true', help='show progress')
+parser.add_argument('--method', required=False, type=str, default='ga',
+	choices=['ga', 'grad', 'cmaes', 'de', 'bo'], help='ga: genetic'
+	' algorithm, grad: gradient descent from --pop random starts, cmaes:'
+	' CMA-ES, de: differential evolution, bo: bayesian optimization with a'
+	' gaussian process [%(default)s]')
+parser.add_argument('--budget', required=False, type=int, default=0,
+	metavar='<int>', help='cmaes, de and bo: fitness evaluations, 0 for'
+	' --pop x --gen, or 100 for bo [%(default)i]')
+parser.add_argument('--proposals', required=False, type=int, default=0,
+	metavar='<int>', help='bo: points evaluated together each round,'
+	' 0 for --cpus [%(default)i]')
+parser.add_argument('--loss', required=False, type=str, default='sq',
+	choices=['kl', 'sq'], help='smooth loss for the gradient [%(default)s]')
+parser.add_argument('--steps', required=False, type=int, default=200,
+	metavar='<int>', help='gradient steps [%(default)i]')
+parser.add_argument('--batch', required=False, type=int, default=0,
+	metavar='<int>', help='grad with --apc_dir: random genes per step,'
+	' 0 for all genes [%(default)i]')
+parser.add_argument('--genes_npz', required=False, type=str, metavar='<file>',
+	help='--apc_dir: feature matrices .npz, created if missing')
+parser.add_argument('--warm', required=False, type=int, default=0,
+	metavar='<int>', help='ga: start this many of the population from'
+	' gradient descent [%(default)i]')
+parser.add_argument('--cache', required=False, type=int, default=100000,
+	metavar='<int>', help='fitness cache entries, 0 for none [%(default)i]')
+parser.add_argument('--digits', required=False, type=int, default=6,
+	metavar='<int>', help='genotypes are rounded to this many digits for'
+	' the cache [%(default)i]')
+parser.add_argument('--patience', required=False, type=int, default=0,
+	metavar='<int>', help='ga, cmaes and de: stop when the best fitness'
+	' improves by less than --tol in this many generations, 0 never'
+	' [%(default)i]')
+parser.add_argument('--tol', required=False, type=float, default=1e-4,
+	metavar='<float>', help='improvement for --patience [%(default)g]')
+parser.add_argument('--log', required=False, type=str, metavar='<file>',
+	help='per generation best, mean fitness and diversity .tsv')
+parser.add_argument('--db', required=False, type=str, metavar='<file>',
+	help='store the best genotype and its fitness for every gene in a'
+	' results .db, see apc/results_lib.py')
+parser.add_argument('--checkpoint', required=False, type=str,
+	metavar='<file>', help='ga: snapshot of the population, rewritten every'
+	' generation')
+parser.add_argument('--resume', action='store_true',
+	help='ga: continue from the generation in --checkpoint')
 
 args = parser.parse_args()
 
-random.seed(datetime.now().timestamp())
+if args.resume and not args.checkpoint:
+	parser.error('--resume needs --checkpoint')
+if args.checkpoint and args.method != 'ga':
+	parser.error('--checkpoint and --resume only work with --method ga')
 
-def chrom():
+if args.seed is not None: random.seed(args.seed)
+else: random.seed(datetime.now().timestamp())
 
-	genotype = {
-		'--welen': random.random(),
-		'--wilen': random.random(),
-		'--wemm': random.random(),
-		'--wimm': random.random(),
-		'--wdpwm': random.random(),
-		'--wapwm': random.random(),
-		'--icost': random.randint(0, 100)
-	}
+# written to a temporary file and renamed, never left half written
+def save_checkpoint(state, fpath):
 
-	return genotype
+	tmp = f'{fpath}.tmp'
+	with open(tmp, 'w') as fp:
+		json.dump(state, fp, indent=1)
+	os.replace(tmp, fpath)
 
-def bad_introns(gff):
+def load_checkpoint(fpath):
 
-	good_ints = 0
-	with open(gff, 'r') as fp:
-		for line in fp.readlines():
-			line = line.rstrip()
-			line = line.split('\t')
-			if line[1] == 'RNASeq_splice': 
-				beg = int(line[3])
-				if beg <= 100 + args.min_exon: continue
-				good_ints += 1
+	if not os.path.exists(fpath): return {}
+	with open(fpath, 'r') as fp:
+		return json.load(fp)
 
-	if good_ints > 1:
-		return False
-	if good_ints <= 1:
-		return True	
+starttime = time.time()
+mdls = icl.read_models(args.elen, args.ilen, args.emm, args.imm, args.dpwm,
+	args.apwm)
 
-def get_fit(chrom, fasta, gff, bli=True):
+if args.apc_dir:
+	pairs = {}
+	for file in os.listdir(args.apc_dir):
+		iid = file.split('.')[1]
+		if iid not in pairs: pairs[iid] = [None, None]
+		if file.endswith('.fa'): pairs[iid][0] = args.apc_dir + file
+		if file.endswith('.gff3'): pairs[iid][1] = args.apc_dir + file
+else:
+	if not args.fasta or not args.gff:
+		parser.error('fasta and gff, or --apc_dir, are required')
+	gid = os.path.basename(args.fasta).split('.')
+	pairs = {gid[1] if len(gid) > 2 else gid[0]: [args.fasta, args.gff]}
 
-	# difference between apc and bli mdist for ch.7184 is significant
-	# only using bli maybe not good?
-	tmpfile = f'tmp.{os.getpid()}.gff'
-	
-	#if bad_introns(args.gff):
-	#	line1 = f'python3 {args.program} {args.fasta} '
-	#else:
-	#	line1 = f'python3 {args.program} {args.fasta} --gff {args.gff} '
-	if bli:
-		line1 = f'python3 {args.program} {fasta} --gff {gff} '
+# enumeration and feature scoring are the slow part, they can be saved
+settings = json.dumps([sorted(pairs), args.max_splice, args.min_intron,
+	args.min_exon, args.flank, args.limit, args.gtag, args.elen, args.ilen,
+	args.emm, args.imm, args.dpwm, args.apwm])
+genes = None
+if args.genes_npz and os.path.exists(args.genes_npz):
+	saved = np.load(args.genes_npz)
+	if str(saved['settings']) == settings:
+		genes = gal.unpack_genes({k: saved[k] for k in saved.files})
 	else:
-		line1 = f'python3 {args.program} {fasta} '
-	cmd = (
-		f'{line1}'
-		f'--icost 22 '
-		f'--max_splice {args.max_splice} --min_intron {args.min_intron} '
-		f'--min_exon {args.min_exon} --flank {args.flank} ' 
-		f'--limit {args.limit} --exon_len {args.elen} '
-		f'--intron_len {args.ilen} --exon_mm {args.emm} '
-		f'--intron_mm {args.imm} --donor_pwm {args.dpwm} '
-		f'--acceptor_pwm {args.apwm} > {tmpfile}'
-		)
-	os.system(cmd)	
-	introns1 = mdl.get_gff_intron_probs(tmpfile)
-	introns2 = mdl.get_gff_intron_probs(gff)
-	fit = mdl.get_mdist(introns1, introns2)
-	os.remove(tmpfile)
+		print('settings changed, not using', args.genes_npz)
+if genes is None:
+	genes = []
+	for iid in sorted(pairs):
+		fa, gff = pairs[iid]
+		genes.append(gal.prep_gene(fa, gff, mdls, maxs=args.max_splice,
+			minin=args.min_intron, minex=args.min_exon, flank=args.flank,
+			limit=args.limit, bli=not args.gtag))
+	if args.genes_npz:
+		np.savez(args.genes_npz, settings=settings, **gal.pack_genes(genes))
+
+# with --cpus the genes are put in shared memory and each worker
+# evaluates a slice of the population on every gene, see the try below
+pool = None
+blocks = []
 
-	return fit
+def genes_fitness(g):
 
-path = '../data/build/apc282/'
-fastas = {}
-gffs = {}
-for file in os.listdir(path):
-	iid = file.split('.')[1]
-	if file.endswith('.fa'): fastas[iid] = path + file
-	if file.endswith('.gff3'): gffs[iid] = path + file
+	if pool: fits = gal.pool_fitness(pool, args.cpus, g)
+	else: fits = np.stack([gal.fitness(gene, g) for gene in genes], axis=1)
 
-pairs = {}
-for iid in fastas:
-	pairs[iid] = []
-	pairs[iid].append(fastas[iid])
+	return fits.mean(axis=1)
 
-for iid in gffs:
-	pairs[iid].append(gffs[iid])
+# entries are the mean fitness over all genes, keyed by their IDs
+cache = gal.new_cache(args.cache, args.digits) if args.cache else None
+gene_set = tuple(sorted(pairs))
 
-count = 0
-for iid in pairs:
-	print(iid)
-	fa = pairs[iid][0] 
-	gff = pairs[iid][1]
-	fit1 = get_fit(chrom, fa, gff)
-	fit2 = get_fit(chrom, fa, gff, bli=False)
-	print('bli:', fit1)
-	print('apc:', fit2)
-	print('#####')
-	count += 1
-	if count == 5: break
+# genotypes evaluated so far, cache hits and gradient steps included
+nevals = 0
 
+def evaluate_matrix(g):
 
+	global nevals
+	nevals += len(g)
+	if cache is None: return genes_fitness(g)
+	return gal.cached_fitness(cache, gene_set, g, genes_fitness)
 
+def evaluate(guys):
+	return evaluate_matrix(gal.genotype_matrix(guys))
 
+def mean_loss_grad(g):
 
+	L = 0
+	grad = 0
+	for gene in genes:
+		gL, ggrad = gal.loss_grad(gene, g, args.loss)
+		L += gL / len(genes)
+		grad += ggrad / len(genes)
 
+	return L, grad
+
+def grad_guys(n):
+
+	guys = [gal.random_guy() for i in range(n)]
+	if n == 0: return guys
+	if args.batch:
+		best, fits = gal.minibatch_descent(genes, gal.genotype_matrix(guys),
+			batch=args.batch, steps=args.steps, loss=args.loss,
+			seed=random.randrange(2**32), fitness_fn=evaluate_matrix)
+	else:
+		best, fits = gal.grad_descent(mean_loss_grad, evaluate_matrix,
+			gal.genotype_matrix(guys), steps=args.steps)
+	for guy, x, fit in zip(guys, best, fits):
+		guy['genotype'] = {w: float(v) for w, v in zip(gal.wts, x)}
+		guy['fitness'] = float(fit)
 
+	return guys
 
+# one line per generation, --verbose prints the same line
+logfp = None
+if args.log:
+	logfp = open(args.log, 'a' if args.resume else 'w')
+	if not args.resume: logfp.write('gen\tbest\tmean\tdiversity\tevals\n')
+bests = []
 
+def track(g, genotypes, fits, evals):
+
+	d = gal.diagnostics(genotypes, fits)
+	line = (f'{g}\t{d["best"]:.6f}\t{d["mean"]:.6f}\t{d["diversity"]:.4f}'
+		f'\t{evals}')
+	if logfp: logfp.write(line + '\n')
+	if args.verbose: print(line)
+	bests.append(d['best'])
+	stop = gal.plateau(bests, args.patience, args.tol)
+	if stop and args.verbose: print('plateau, stopping at generation', g)
+
+	return stop
+
+# the pool and the shared memory are released however the run ends
+try:
+	if args.cpus > 1:
+		blocks, meta = gal.share_genes(genes)
+		pool = mp.Pool(args.cpus, initializer=gal.attach_genes,
+			initargs=(meta,))
+
+	# the random state is saved too, a resumed run continues the same sequence
+	# resume needs the same genes, models and settings that shape the population
+	ckpt_settings = {
+		'genes': settings,
+		'method': args.method,
+		'bounds': gal.upper.tolist(),
+		'pop': args.pop,
+		'die': args.die
+	}
+	start = 0
+	pop = None
+	if args.resume:
+		state = load_checkpoint(args.checkpoint)
+		if state:
+			if state.get('settings') != ckpt_settings:
+				sys.exit('genes, models, method, bounds, pop or die changed,'
+					' cannot resume')
+			start = state['gen'] + 1
+			pop = state['pop']
+			bests += state['bests']
+			nevals = state['evals']
+			rs = state['random']
+			random.setstate((rs[0], tuple(rs[1]), rs[2]))
+			print('resuming at generation', start)
+	if args.method == 'grad':
+		pop = grad_guys(args.pop)
+		start = args.gen
+	elif args.method in ('cmaes', 'de', 'bo'):
+		seed = random.randrange(2**32)
+		if args.method == 'bo':
+			search = gal.bayes_opt(evaluate_matrix,
+				batch=args.proposals or args.cpus, budget=args.budget or 100,
+				seed=seed)
+		else:
+			search = (gal.cmaes if args.method == 'cmaes' else gal.diff_evo)(
+				evaluate_matrix, pop=args.pop,
+				budget=args.budget or args.pop * args.gen, seed=seed)
+		best = None
+		for step in search:
+			best = step
+			if track(step['gen'], step['pop'], step['fits'], step['evals']): break
+		if best is None: parser.error('--budget is less than one generation')
+		pop = [{'genotype': {w: float(v) for w, v in zip(gal.wts, best['best'])},
+			'fitness': float(best['best_fit'])}]
+		start = args.gen
+	elif pop is None:
+		pop = grad_guys(min(args.warm, args.pop))
+		pop += [gal.random_guy() for i in range(args.pop - len(pop))]
 
+	for g, pop in gal.evolve(pop, args.gen, args.die, args.mut, evaluate, start):
+		stop = track(g, gal.genotype_matrix(pop), [guy['fitness'] for guy in pop],
+			nevals)
+		if args.checkpoint:
+			save_checkpoint({'settings': ckpt_settings, 'gen': g, 'pop': pop,
+				'bests': bests, 'evals': nevals, 'random': random.getstate()},
+				args.checkpoint)
+		if stop: break
+except BaseException:
+	if pool: pool.terminate()
+	raise
+finally:
+	if pool:
+		pool.close()
+		pool.join()
+	gal.free_genes(blocks)
+	if logfp: logfp.close()
 
+pop = sorted(pop, key=lambda guy: guy['fitness'])
 
+# one row per gene, the fitness of the best genotype on that gene
+# icost is divided by 100 into apc_isogen.py units, as results_lib expects
+if args.db:
+	best = gal.genotype_matrix(pop[:1])
+	rows = []
+	for gid, gene in zip(sorted(pairs), genes):
+		fit = float(gal.fitness(gene, best)[0])
+		rows.append([gid, fit] + [pop[0]['genotype'][w] for w in gal.wts[:6]]
+			+ [pop[0]['genotype']['icost'] / 100])
+	conn = rl.connect(args.db)
+	run_id = rl.add_run(conn, 'ga', {k: v for k, v in vars(args).items()
+		if k not in ('db', 'verbose', 'resume')})
+	rl.add_fitness(conn, run_id, rows)
+	conn.close()
+	print('db run:', run_id)
+if cache and args.verbose: print('fitness cache:', gal.cache_stats(cache))
+print('time:', time.time() - starttime)
+print(json.dumps(pop[0]))
@@ -1,4 +1,5 @@
 import isosort_lib as isl
+import results_lib as rl
 import argparse
 import os
 import json
@@ -11,7 +12,9 @@ parser.add_argument('wb_dir', type=str, metavar='<directory>',
 parser.add_argument('apcgen_dir', type=str, metavar='<directory>',
 	help='directory with apc generated gff files')
 parser.add_argument('--weights', type=str, metavar='<file>',
-	help='file with individual gene weights')
+	help='file with individual gene weights, or a results .db')
+parser.add_argument('--run', type=int, metavar='<int>',
+	help='--weights .db: run to take the weights from, default the latest')
 parser.add_argument('--elen', type=str, metavar='<file>',
 	help='exon length model .tsv')
 parser.add_argument('--ilen', type=str, metavar='<file>',
@@ -47,29 +50,35 @@ for fname in os.listdir(args.apcgen_dir):
 	paths[gID] += [args.apcgen_dir+fname]
 
 gwts = {}
-with open(args.weights, 'r') as fp:
-	for line in fp.readlines():
-		line = line.rstrip()
-		line = line.split('\t')
-		fit = line[0]
-		wdpwm = line[1]
-		wapwm = line[2]
-		wemm = line[3]
-		wimm = line[4]
-		welen = line[5]
-		wilen = line[6]
-		icost = line[7]
-		gid = line[8].split('.')[1]
-		gwts[gid] = {
-			'fit': fit,
-			'wdpwm': float(wdpwm),
-			'wapwm': float(wapwm),
-			'wemm': float(wemm),
-			'wimm': float(wimm),
-			'welen': float(welen),
-			'wilen': float(wilen),
-			'icost': float(icost)
-			}
+if args.weights.endswith('.db'):
+	conn = rl.connect(args.weights)
+	run_id = args.run if args.run else rl.latest_fitness_run(conn)
+	gwts = rl.best_weights(conn, run_id)
+	conn.close()
+else:
+	with open(args.weights, 'r') as fp:
+		for line in fp.readlines():
+			line = line.rstrip()
+			line = line.split('\t')
+			fit = line[0]
+			wdpwm = line[1]
+			wapwm = line[2]
+			wemm = line[3]
+			wimm = line[4]
+			welen = line[5]
+			wilen = line[6]
+			icost = line[7]
+			gid = line[8].split('.')[1]
+			gwts[gid] = {
+				'fit': fit,
+				'wdpwm': float(wdpwm),
+				'wapwm': float(wapwm),
+				'wemm': float(wemm),
+				'wimm': float(wimm),
+				'welen': float(welen),
+				'wilen': float(wilen),
+				'icost': float(icost)
+				}
 
 os.makedirs('sort_out/', exist_ok=True)
 
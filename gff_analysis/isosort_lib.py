@@ -2,6 +2,7 @@ import re
 import os
 import json
 import isomod as im
+import gff_lib as gl
 
 def get_seq(fasta):
 
@@ -19,24 +20,22 @@ def get_seq(fasta):
 def get_wbgene_info(wb_gff, seq):
 	
 	wbginfo = {}
-	with open(wb_gff, 'r') as fp:
-		wbg = {}
-		wbg['mRNA'] = []
-		wbg['exons'] = []
-		wbg['introns'] = []
-		for line in fp.readlines():
-			line = line.rstrip()
-			sline = line.split('\t')
-			if sline[2] == 'mRNA':
-				name = sline[0]+'-wb'
-				wbg['mRNA'] = [int(sline[3]), int(sline[4])]
-				WBGene = sline[8].split(':')[2]
-				wbg['Parent=Gene'] = WBGene
-			if sline[2] == 'CDS':
-				wbg['exons'].append((int(sline[3]), int(sline[4])))
-			if sline[1] == 'WormBase' and sline[2] == 'intron':
-				wbg['introns'].append((int(sline[3]), int(sline[4])))
-		wbginfo[name] = wbg
+	index = gl.read_gff(wb_gff)
+	wbg = {}
+	wbg['mRNA'] = []
+	wbg['exons'] = []
+	wbg['introns'] = []
+	for seqid in index:
+		for f in gl.get_features(index, 'mRNA', seqid=seqid):
+			name = seqid+'-wb'
+			wbg['mRNA'] = [f['beg'], f['end']]
+			WBGene = f['attr'].split(':')[2]
+			wbg['Parent=Gene'] = WBGene
+	for f in gl.get_features(index, 'CDS'):
+		wbg['exons'].append((f['beg'], f['end']))
+	for f in gl.get_features(index, 'intron', source='WormBase'):
+		wbg['introns'].append((f['beg'], f['end']))
+	wbginfo[name] = wbg
 		
 	for gID in wbginfo:
 		for ft in wbginfo[gID]:
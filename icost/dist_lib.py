@@ -0,0 +1,82 @@
+import numpy as np
+
+# distances between intron distributions, many candidates against one reference
+# distributions are dicts {(beg, end): prob} as returned by mdist_lib
+# they are aligned to a shared intron index, missing introns are 0
+# candidates are rows of a (candidates x introns) array
+
+def intron_index(*dists):
+
+	index = {}
+	for dist in dists:
+		for intron in dist:
+			if intron not in index: index[intron] = len(index)
+
+	return index
+
+def to_array(dist, index):
+
+	a = np.zeros(len(index))
+	for intron in dist:
+		a[index[intron]] = dist[intron]
+
+	return a
+
+def to_matrix(dists, index):
+
+	m = np.zeros((len(dists), len(index)))
+	for k, dist in enumerate(dists):
+		for intron in dist:
+			m[k, index[intron]] = dist[intron]
+
+	return m
+
+# reference and candidate dicts to (ref array, candidate matrix, index)
+def align(ref, candidates):
+
+	index = intron_index(ref, *candidates)
+
+	return to_array(ref, index), to_matrix(candidates, index), index
+
+def manhattan(p, q):
+	return np.abs(np.asarray(p) - q).sum(axis=-1)
+
+# eps keeps introns missing from one side finite, both sides are renormalized
+def kl(p, q, eps=1e-9):
+
+	p = np.asarray(p) + eps
+	q = np.asarray(q) + eps
+	p = p / p.sum(axis=-1, keepdims=True)
+	q = q / q.sum(axis=-1, keepdims=True)
+
+	return (p * np.log2(p / q)).sum(axis=-1)
+
+# base 2, between 0 and 1
+def js(p, q):
+
+	p = np.asarray(p)
+	q = np.broadcast_to(q, p.shape)
+	m = (p + q) / 2
+	with np.errstate(divide='ignore', invalid='ignore'):
+		dp = np.where(p > 0, p * np.log2(p / m), 0)
+		dq = np.where(q > 0, q * np.log2(q / m), 0)
+
+	return (dp.sum(axis=-1) + dq.sum(axis=-1)) / 2
+
+def hellinger(p, q):
+	return np.sqrt(((np.sqrt(p) - np.sqrt(q)) ** 2).sum(axis=-1) / 2)
+
+metrics = {
+	'manhattan': manhattan,
+	'kl': kl,
+	'js': js,
+	'hellinger': hellinger
+}
+
+# one distance per candidate, candidates can be dicts or an aligned matrix
+def distances(ref, candidates, metric='manhattan'):
+
+	if isinstance(ref, dict):
+		ref, candidates, index = align(ref, candidates)
+
+	return metrics[metric](candidates, ref)
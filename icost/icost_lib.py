@@ -0,0 +1,280 @@
+import json
+import os
+import pickle
+import numpy as np
+import apc_model_lib as aml
+import mdist_lib as mdl
+import refdist_lib as rdl
+import dist_lib as dl
+
+# scoring is the same as apc_score.py, without writing/reading gffs
+# isoforms and models are loaded once per gene, icost only shifts scores
+
+def read_models(exon_len, intron_len, exon_mm, intron_mm, donor_pwm,
+				acceptor_pwm):
+
+	mdls = {}
+	mdls['elen'] = aml.read_exin_len(exon_len)[1]
+	mdls['elen_params'] = aml.read_len_params(exon_len)
+	mdls['ilen'] = aml.read_exin_len(intron_len)[1]
+	mdls['ilen_params'] = aml.read_len_params(intron_len)
+	mdls['emm'] = aml.read_exin_mm(exon_mm)[1]
+	mdls['imm'] = aml.read_exin_mm(intron_mm)[1]
+	mdls['dpwm'] = aml.read_pwm(donor_pwm)[1]
+	mdls['apwm'] = aml.read_pwm(acceptor_pwm)[1]
+
+	return mdls
+
+def read_seq(fasta):
+
+	seqid = None
+	seq = None
+	for seqid, seq in aml.read_fastas(fasta):
+		seqid = seqid
+		seq = seq
+
+	return seqid, seq
+
+def read_isoforms(apc_pkl):
+
+	with open(apc_pkl, 'rb') as pick:
+		apc_isoforms = pickle.load(pick)
+
+	return apc_isoforms
+
+# exon and intron scores of every isoform, icost not included
+def get_base_scores(apc_isoforms, seq, mdls):
+
+	ea, eb, eg = mdls['elen_params']
+	ia, ib, ig = mdls['ilen_params']
+	exon_scores = {}
+	intron_scores = {}
+	base_scores = []
+	for iso in apc_isoforms:
+		total_iso_score = 0
+		for exon in iso['exons']:
+			if exon in exon_scores: continue
+			elen_score = aml.get_exin_len_score(exon, mdls['elen'], ea, eb, eg)
+			emm_score = aml.get_exin_mm_score(exon, seq, mdls['emm'])
+			exon_scores[exon] = elen_score + emm_score
+		for intron in iso['introns']:
+			if intron in intron_scores: continue
+			ilen_score = aml.get_exin_len_score(intron, mdls['ilen'],
+				ia, ib, ig)
+			imm_score = aml.get_exin_mm_score(intron, seq, mdls['imm'],
+				'GT', 'AG')
+			dseq, aseq = aml.get_donacc_seq(intron, seq)
+			dpwm_score = aml.get_donacc_pwm_score(dseq, mdls['dpwm'])
+			apwm_score = aml.get_donacc_pwm_score(aseq, mdls['apwm'])
+			iscore = ilen_score + imm_score + dpwm_score + apwm_score
+			intron_scores[intron] = iscore
+		for exon in iso['exons']:
+			total_iso_score += exon_scores[exon]
+		for intron in iso['introns']:
+			total_iso_score += intron_scores[intron]
+		base_scores.append(total_iso_score)
+
+	return base_scores
+
+# intron probabilities as mdl.get_gff_intron_probs reads apc_score.py output
+def get_intron_probs(apc_isoforms, base_scores, icost):
+
+	scored = []
+	for iso, base in zip(apc_isoforms, base_scores):
+		scored.append((base - len(iso['introns']) * icost, iso))
+	scored = sorted(scored, key=lambda s: s[0], reverse=True)
+
+	iso_weights = []
+	iso_total = 0
+	for score, iso in scored:
+		iso_weight = 2 ** score
+		iso_weights.append(iso_weight)
+		iso_total += iso_weight
+
+	iso_probs = []
+	for w in iso_weights:
+		iso_probs.append(w / iso_total)
+
+	return mdl.get_apc_intron_probs([s[1] for s in scored], iso_probs)
+
+# yields (icost, mdist) for one gene
+# base_scores can come from an isoform archive with features
+def icost_sweep(apc_isoforms, seq, mdls, wb_gff, icosts, base_scores=None):
+
+	if base_scores is None:
+		base_scores = get_base_scores(apc_isoforms, seq, mdls)
+	for icost in icosts:
+		introns1 = get_intron_probs(apc_isoforms, base_scores, icost)
+		introns2 = rdl.ref_introns(wb_gff)
+		yield icost, mdl.get_mdist(introns1, introns2)
+
+##### broadcast sweep #####
+
+# within a gene icost only shifts each isoform by n_introns * icost
+# so all icosts are evaluated together as (icost x isoform) arrays
+
+# (isoform, intron) pairs sorted by intron, 1-based gff coordinates
+def get_intron_index(apc_isoforms):
+
+	introns = {}
+	iso_idx = []
+	int_idx = []
+	for k, iso in enumerate(apc_isoforms):
+		for intron in iso['introns']:
+			intron = (intron[0]+1, intron[1]+1)
+			if intron not in introns: introns[intron] = len(introns)
+			iso_idx.append(k)
+			int_idx.append(introns[intron])
+
+	order = np.argsort(int_idx, kind='stable')
+	iso_idx = np.array(iso_idx)[order]
+	int_idx = np.array(int_idx)[order]
+	starts = np.searchsorted(int_idx, np.arange(len(introns)))
+
+	return list(introns), iso_idx, starts
+
+# intron probabilities for every icost, rows are icosts
+def get_intron_probs_2d(base_scores, nints, iso_idx, starts, icosts):
+
+	scores = base_scores[None, :] - icosts[:, None] * nints[None, :]
+	scores -= scores.max(axis=1, keepdims=True)
+	weights = np.exp2(scores)
+	probs = weights / weights.sum(axis=1, keepdims=True)
+	iprobs = np.add.reduceat(probs[:, iso_idx], starts, axis=1)
+
+	return iprobs / iprobs.sum(axis=1, keepdims=True)
+
+# everything the broadcast sweep needs for one gene
+def prep_gene(apc_isoforms, seq, mdls, wb_gff, base_scores=None):
+
+	if base_scores is None:
+		base_scores = get_base_scores(apc_isoforms, seq, mdls)
+	gene = {}
+	gene['base_scores'] = np.array(base_scores, dtype=float)
+	gene['nints'] = np.array([len(iso['introns']) for iso in apc_isoforms])
+	introns, gene['iso_idx'], gene['starts'] = get_intron_index(apc_isoforms)
+
+	ref = rdl.get_ref(wb_gff)
+	gene['ref'], gene['ref_only'], gene['isonum'] = rdl.align_ref(ref, introns)
+
+	return gene
+
+# unrounded mdist for every icost
+def gene_mdists(gene, icosts, max_cells=10000000):
+
+	icosts = np.asarray(icosts, dtype=float)
+	mdists = np.zeros(len(icosts))
+	block = max(1, max_cells // max(1, len(gene['iso_idx'])))
+	for b in range(0, len(icosts), block):
+		iprobs = get_intron_probs_2d(gene['base_scores'], gene['nints'],
+			gene['iso_idx'], gene['starts'], icosts[b:b+block])
+		mdists[b:b+block] = dl.manhattan(iprobs, gene['ref'])
+	mdists += gene['ref_only']
+
+	return mdists
+
+# same output as icost_sweep, probabilities are not rounded to {:.5e}
+def icost_sweep_broadcast(apc_isoforms, seq, mdls, wb_gff, icosts,
+		base_scores=None):
+
+	gene = prep_gene(apc_isoforms, seq, mdls, wb_gff, base_scores)
+	for icost, mdist in zip(icosts, gene_mdists(gene, icosts)):
+		yield float(icost), (float('{0:.6f}'.format(mdist)), gene['isonum'])
+
+##### icost search #####
+
+# coarse scan, then golden-section search in the bracket around the best
+# grid point, f takes an array of icosts and returns an array of mdists
+def icost_search(f, lo, up, coarse=11, tol=0.01, max_evals=100):
+
+	xs = np.linspace(lo, up, coarse)
+	ys = f(xs)
+	evals = coarse
+	i = int(np.argmin(ys))
+	a = xs[max(i-1, 0)]
+	b = xs[min(i+1, coarse-1)]
+	best_x, best_y = xs[i], ys[i]
+
+	gr = (np.sqrt(5) - 1) / 2
+	c = b - gr * (b - a)
+	d = a + gr * (b - a)
+	fc, fd = f([c, d])
+	evals += 2
+	while abs(b - a) > tol and evals < max_evals:
+		if fc < fd:
+			b, d, fd = d, c, fc
+			c = b - gr * (b - a)
+			fc = f([c])[0]
+		else:
+			a, c, fc = c, d, fd
+			d = a + gr * (b - a)
+			fd = f([d])[0]
+		evals += 1
+
+	for x, y in ((c, fc), (d, fd)):
+		if y < best_y: best_x, best_y = x, y
+
+	return float(best_x), float(best_y), evals
+
+# objectives for icost_search
+def gene_objective(gene):
+	return lambda icosts: gene_mdists(gene, icosts)
+
+def global_objective(genes):
+	return lambda icosts: sum(gene_mdists(g, icosts) for g in genes) \
+		/ len(genes)
+
+##### results #####
+
+# one line per (gene, icost), written as genes finish
+def write_gene_results(fp, ID, results):
+
+	for icost, mdist in results:
+		fp.write(json.dumps({'ID': ID, 'icost': icost, 'mdist': mdist}) + '\n')
+	fp.flush()
+
+def read_results(jsonl):
+
+	records = []
+	with open(jsonl, 'r') as fp:
+		for line in fp:
+			if not line.endswith('\n'): break
+			records.append(json.loads(line))
+
+	return records
+
+# legacy results_icost.json, genes within an icost follow order
+def merge_results(jsonl, out, order=None):
+
+	icost_groups = {}
+	for r in read_results(jsonl):
+		info = {'ID': r['ID'], 'mdist': r['mdist']}
+		if r['icost'] not in icost_groups: icost_groups[r['icost']] = []
+		icost_groups[r['icost']].append(info)
+
+	if order is not None:
+		rank = {ID: i for i, ID in enumerate(order)}
+		for icost in icost_groups:
+			icost_groups[icost].sort(key=lambda info: rank[info['ID']])
+
+	with open(out, 'w') as fp:
+		fp.write(json.dumps(sorted(icost_groups.items()), indent=4))
+
+# keeps genes that have all icosts, drops partial genes and any cut-off line
+# the file is rewritten atomically, new results are appended after it
+def resume_results(jsonl, nicosts):
+
+	if not os.path.exists(jsonl): return set()
+	records = read_results(jsonl)
+	counts = {}
+	for r in records:
+		counts[r['ID']] = counts.get(r['ID'], 0) + 1
+	done = {ID for ID in counts if counts[ID] == nicosts}
+
+	tmp = f'{jsonl}.tmp'
+	with open(tmp, 'w') as fp:
+		for r in records:
+			if r['ID'] in done: fp.write(json.dumps(r) + '\n')
+	os.replace(tmp, jsonl)
+
+	return done
@@ -1,14 +1,17 @@
-import subprocess
 import os
+import sys
 import argparse
+import multiprocessing as mp
 import numpy as np
-import mdist_lib as mdl
+import icost_lib as icl
+import isoarc_lib as iarc
+import refdist_lib as rdl
+import results_lib as rl
 import json
-import shutil
 
 parser = argparse.ArgumentParser()
 parser.add_argument('apc_pkls', type=str, metavar='<directory>', 
-	help='input directory with apc pickle files')
+	help='input directory with apc pickle files, or an isoform archive')
 parser.add_argument('apc_dir', type=str, metavar='<directory>',
 	help='input directory with apc fasta gff files')
 parser.add_argument('--outdir', type=str, metavar='<outdir path>',
@@ -33,21 +36,34 @@ parser.add_argument('--icost_range_lo', required=False, type=float, default=0,
 	metavar='<int>', help='intron cost lower range %(default)i')
 parser.add_argument('--icost_step', required=False, type=float, default=0.1,
 	metavar='<float>', help='intron cost step %(default).1f')
+parser.add_argument('--mode', required=False, type=str, default='loop',
+	choices=['loop', 'broadcast', 'search'], help='loop: same numbers as'
+	' apc_score.py, broadcast: all icosts in one vectorized pass,'
+	' search: coarse scan and golden-section search [%(default)s]')
+parser.add_argument('--objective', required=False, type=str, default='global',
+	choices=['gene', 'global'], help='search: best icost per gene or for the'
+	' average mdist of all genes [%(default)s]')
+parser.add_argument('--cpus', required=False, type=int, default=1,
+	metavar='<int>', help='loop/broadcast: genes run in parallel %(default)i')
+parser.add_argument('--ref_cache', required=False, type=str, metavar='<file>',
+	help='.json cache of WormBase intron distributions, created if missing')
+parser.add_argument('--resume', action='store_true',
+	help='loop/broadcast: keep finished genes in results_icost.jsonl,'
+	' only run the rest')
+parser.add_argument('--db', required=False, type=str, metavar='<file>',
+	help='loop/broadcast: also store the mdists in a results .db')
+parser.add_argument('--features', action='store_true',
+	help='archive only: save icost-free isoform scores in the archive,'
+	' reused while the model files stay the same')
+parser.add_argument('--coarse', required=False, type=int, default=11,
+	metavar='<int>', help='search: points in the coarse scan %(default)i')
+parser.add_argument('--tol', required=False, type=float, default=0.01,
+	metavar='<float>', help='search: icost tolerance %(default).2f')
 
 args = parser.parse_args()
 
-program = 'apc_score.py'
 apc_dir = args.apc_dir
 pkl_dir = args.apc_pkls
-tmp_outdir = 'icost_tmp/'
-os.makedirs(os.path.dirname(tmp_outdir), exist_ok=True)
-
-exon_mm = args.exon_mm
-intron_mm = args.intron_mm
-exon_len = args.exon_len
-intron_len = args.intron_len
-donor_pwm = args.donor_pwm
-acceptor_pwm = args.acceptor_pwm
 
 fasta_paths = {}
 for fname in os.listdir(apc_dir):
@@ -56,11 +72,17 @@ for fname in os.listdir(apc_dir):
 		fpath = apc_dir + fname
 		fasta_paths[ID1] = fpath
 
+arc = None
 pkl_paths = {}
-for fname in os.listdir(pkl_dir):
-	ID2 = fname.split('.')[1]
-	ppath = pkl_dir + fname
-	pkl_paths[ID2] = ppath
+if iarc.is_archive(pkl_dir):
+	arc = iarc.read_archive(pkl_dir)
+	for ID2 in arc['genes']:
+		pkl_paths[ID2] = None
+else:
+	for fname in os.listdir(pkl_dir):
+		ID2 = fname.split('.')[1]
+		ppath = pkl_dir + fname
+		pkl_paths[ID2] = ppath
 
 irange_up = int(args.icost_range_up)
 irange_lo = int(args.icost_range_lo)
@@ -73,49 +95,137 @@ for wbfile in os.listdir(apc_dir):
 	wb_path = apc_dir + wbfile
 	wb_gffs[wID] = wb_path
 
-icost_groups = {}
-for i in np.arange(irange_lo, irange_up+0.1, irange_step):
-	icost = round(i, 2)
+icosts = [round(i, 2) for i in np.arange(irange_lo, irange_up+0.1, irange_step)]
+
+# reference distributions are parsed once, before any workers start
+if args.ref_cache: rdl.load_cache(args.ref_cache)
+for ID in pkl_paths:
+	rdl.get_ref(wb_gffs[ID])
+if args.ref_cache: rdl.save_cache(args.ref_cache)
+
+mdls = icl.read_models(args.exon_len, args.intron_len, args.exon_mm,
+	args.intron_mm, args.donor_pwm, args.acceptor_pwm)
+mdl_files = [os.path.abspath(f) for f in [args.exon_len, args.intron_len,
+	args.exon_mm, args.intron_mm, args.donor_pwm, args.acceptor_pwm]]
+
+# archive features are only used if made with the same model files
+use_features = arc is not None and arc['features'] is not None \
+	and arc['meta'].get('features') == mdl_files
+new_features = {}
+
+def read_gene(ID):
+
+	seqid, seq = icl.read_seq(fasta_paths[ID])
+	if arc is None:
+		return seq, icl.read_isoforms(pkl_paths[ID]), None
+	apc_isoforms = iarc.gene_isoforms(arc, ID)
+	if use_features:
+		base_scores = np.asarray(iarc.gene_features(arc, ID))
+	else:
+		base_scores = icl.get_base_scores(apc_isoforms, seq, mdls)
+		new_features[ID] = base_scores
+
+	return seq, apc_isoforms, base_scores
+
+def save_features():
+
+	if not args.features or arc is None or use_features: return
+	if any(g['ID'] not in new_features for g in arc['meta']['genes']): return
+	features = []
+	for g in arc['meta']['genes']:
+		features += new_features[g['ID']]
+	iarc.write_features(arc, features, mdl_files)
+
+if args.mode == 'search':
+	genes = {}
 	for ID in pkl_paths:
-		pkl_file = pkl_paths[ID]
-		fa_file = fasta_paths[ID]
-		if 'bli' in pkl_paths[ID].split('.'):
-			gff_name = 'ch.'+ID+'.icost_'+str(icost)+'_'+'bli.gff'
-		else:
-			gff_name = 'ch.'+ID+'.icost_'+str(icost)+'_'+'apc.gff'
-		agff_path = tmp_outdir+gff_name
-		subprocess.run(f'python3 {program} {pkl_file} {fa_file}'
-			f' --exon_len {exon_len} --intron_len {intron_len}'
-			f' --exon_mm {exon_mm} --intron_mm {intron_mm}'
-			f' --donor_pwm {donor_pwm} --acceptor_pwm {acceptor_pwm}'
-			f' --icost {icost} > {agff_path}', shell=True )
+		seq, apc_isoforms, base_scores = read_gene(ID)
+		genes[ID] = icl.prep_gene(apc_isoforms, seq, mdls, wb_gffs[ID],
+			base_scores)
+	save_features()
+
+	if args.objective == 'global':
+		f = icl.global_objective(list(genes.values()))
+		icost, mdist, evals = icl.icost_search(f, irange_lo, irange_up,
+			coarse=args.coarse, tol=args.tol)
+		print('best icost:', icost, 'avg mdist:', mdist, 'evaluations:', evals)
+		results = {'icost': icost, 'avg_mdist': mdist, 'evals': evals}
+	else:
+		results = {}
+		for ID in genes:
+			f = icl.gene_objective(genes[ID])
+			icost, mdist, evals = icl.icost_search(f, irange_lo, irange_up,
+				coarse=args.coarse, tol=args.tol)
+			print('gene ID:', ID, 'best icost:', icost, 'mdist:', mdist,
+				'evaluations:', evals)
+			results[ID] = {'icost': icost, 'mdist': mdist, 'evals': evals}
+
+	jsonString = json.dumps(results, indent=4)
+	if args.outdir: jsonFile = open(args.outdir+'results_search.json', 'w')
+	else: jsonFile = open('results_search.json', 'w')
+	jsonFile.write(jsonString)
+	jsonFile.close()
+	sys.exit()
+
+# each gene is swept over all icosts, results are streamed to .jsonl
+# as genes finish and merged into the legacy .json at the end
+def sweep_gene(ID):
+
+	seq, apc_isoforms, base_scores = read_gene(ID)
+	if args.mode == 'broadcast': sweep = icl.icost_sweep_broadcast
+	else: sweep = icl.icost_sweep
+	results = list(sweep(apc_isoforms, seq, mdls, wb_gffs[ID], icosts,
+		base_scores))
+
+	return ID, results, new_features.get(ID)
+
+if args.outdir: jsonl = args.outdir+'results_icost.jsonl'
+else: jsonl = 'results_icost.jsonl'
+
+# run settings are saved next to the .jsonl, resume needs the same ones
+run = {
+	'icosts': icosts,
+	'mode': args.mode,
+	'models': mdl_files,
+	'genes': sorted(pkl_paths)
+}
+finished = set()
+if args.resume and os.path.exists(jsonl+'.run'):
+	with open(jsonl+'.run', 'r') as fp:
+		if json.load(fp) != run:
+			sys.exit('icost range, mode, models or genes changed, cannot resume')
+	finished = icl.resume_results(jsonl, len(icosts))
+	print('resuming,', len(finished), 'genes done')
+elif args.resume and os.path.exists(jsonl):
+	# results of unknown settings are never resumed nor overwritten
+	sys.exit(f'{jsonl}.run is missing, cannot resume {jsonl}')
+else:
+	with open(jsonl+'.run', 'w') as fp:
+		json.dump(run, fp)
+	open(jsonl, 'w').close()
+todo = [ID for ID in pkl_paths if ID not in finished]
+
+if args.cpus > 1:
+	pool = mp.Pool(args.cpus)
+	done = pool.imap_unordered(sweep_gene, todo)
+else:
+	done = map(sweep_gene, todo)
+
+with open(jsonl, 'a') as fp:
+	for ID, results, features in done:
 		print('#')
 		print('gene ID:', ID)
-		print('tested icost:', icost)
-		#print(agff_path)
-		#print(wb_gffs[ID])
-		introns1 = mdl.get_gff_intron_probs(agff_path)
-		introns2 = mdl.get_gff_intron_probs(wb_gffs[ID])
-		mdist = mdl.get_mdist(introns1, introns2)
-		os.remove(agff_path)
-		print('mdist:', mdist)
-		info = [
-			{
-				'ID': ID,
-				'mdist': mdist
-			}
-		]
-		if icost not in icost_groups:
-			icost_groups[icost] = info
-		else:
-			icost_groups[icost] += info
-
-shutil.rmtree(tmp_outdir)
-
-jsonString = json.dumps(sorted(icost_groups.items()), indent=4)
-if args.outdir:
-	jsonFile = open(args.outdir+'results_icost.json', 'w')
-else:
-	jsonFile = open('results_icost.json', 'w')
-jsonFile.write(jsonString)
-jsonFile.close()
+		print('tested icosts:', len(results))
+		if features is not None: new_features[ID] = features
+		icl.write_gene_results(fp, ID, results)
+if args.cpus > 1: pool.close()
+save_features()
+
+if args.outdir: jfile = args.outdir+'results_icost.json'
+else: jfile = 'results_icost.json'
+icl.merge_results(jsonl, jfile, list(pkl_paths))
+
+if args.db:
+	conn = rl.connect(args.db)
+	rl.import_icost(conn, jfile, run)
+	conn.close()
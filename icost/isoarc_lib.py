@@ -0,0 +1,166 @@
+import json
+import os
+import shutil
+import numpy as np
+
+# columnar archive of apc isoforms for many genes, replaces one pickle per gene
+# arrays are opened with mmap_mode='r' so sweep workers share the same pages
+#
+# archive/
+#	meta.json		genes: ID, seqid, seq length, beg, end, first isoform
+#	isoforms.npy	int64 (isoforms+1), offsets into sites.npy
+#	sites.npy		int32 (introns, 2), donor and acceptor of every intron
+#	features.npy	optional float64 (isoforms), icost-free scores
+#
+# exons are not stored, they follow from beg, end and the introns
+# same coordinates as aml.apc, the sequence is read from the fasta
+
+# genes can be a generator, each gene is appended to raw files in the
+# temporary dir as it comes, only meta.json stays in memory
+def new_archive(outdir):
+
+	tmp = outdir.rstrip('/') + '.tmp/'
+	if os.path.exists(tmp): shutil.rmtree(tmp)
+	os.makedirs(tmp)
+
+	w = {
+		'outdir': outdir,
+		'tmp': tmp,
+		'meta': {'version': 1, 'genes': []},
+		'offsets': open(tmp+'isoforms.raw', 'wb'),
+		'sites': open(tmp+'sites.raw', 'wb'),
+		'niso': 0,
+		'nsites': 0
+	}
+	w['offsets'].write(np.zeros(1, dtype=np.int64).tobytes())
+
+	return w
+
+def add_gene(w, ID, seqid, seq, apc_isoforms):
+
+	beg = apc_isoforms[0]['beg'] if apc_isoforms else 0
+	end = apc_isoforms[0]['end'] if apc_isoforms else 0
+	w['meta']['genes'].append({
+		'ID': ID,
+		'seqid': seqid,
+		'length': len(seq),
+		'beg': beg,
+		'end': end,
+		'first': w['niso'],
+		'isoforms': len(apc_isoforms)
+	})
+	sites = []
+	offsets = []
+	for iso in apc_isoforms:
+		sites += iso['introns']
+		offsets.append(w['nsites'] + len(sites))
+	w['sites'].write(np.array(sites, dtype=np.int32).reshape(-1, 2).tobytes())
+	w['offsets'].write(np.array(offsets, dtype=np.int64).tobytes())
+	w['niso'] += len(apc_isoforms)
+	w['nsites'] += len(sites)
+
+def _raw_to_npy(raw, npy, dtype, shape):
+
+	arr = np.lib.format.open_memmap(npy, mode='w+', dtype=dtype, shape=shape)
+	if arr.size > 0: arr[:] = np.memmap(raw, dtype=dtype, mode='r', shape=shape)
+	arr.flush()
+	del arr
+	os.remove(raw)
+
+# readers never see a partial archive, the temporary dir is renamed at the end
+def close_archive(w):
+
+	w['offsets'].close()
+	w['sites'].close()
+	tmp = w['tmp']
+	_raw_to_npy(tmp+'isoforms.raw', tmp+'isoforms.npy', np.int64,
+		(w['niso']+1,))
+	_raw_to_npy(tmp+'sites.raw', tmp+'sites.npy', np.int32, (w['nsites'], 2))
+	with open(tmp+'meta.json', 'w') as fp:
+		json.dump(w['meta'], fp, indent=1)
+	if os.path.exists(w['outdir']): shutil.rmtree(w['outdir'])
+	os.replace(tmp, w['outdir'])
+
+# genes are (ID, seqid, seq, apc_isoforms)
+def write_archive(genes, outdir):
+
+	w = new_archive(outdir)
+	for ID, seqid, seq, apc_isoforms in genes:
+		add_gene(w, ID, seqid, seq, apc_isoforms)
+	close_archive(w)
+
+def is_archive(path):
+	return os.path.isfile(os.path.join(path, 'meta.json'))
+
+# arrays are mmap views, nothing is read until it is indexed
+def read_archive(path):
+
+	arc = {'path': path}
+	with open(os.path.join(path, 'meta.json'), 'r') as fp:
+		arc['meta'] = json.load(fp)
+	arc['genes'] = {g['ID']: g for g in arc['meta']['genes']}
+	arc['offsets'] = np.load(os.path.join(path, 'isoforms.npy'), mmap_mode='r')
+	arc['sites'] = np.load(os.path.join(path, 'sites.npy'), mmap_mode='r')
+	arc['features'] = None
+	fpath = os.path.join(path, 'features.npy')
+	if os.path.exists(fpath):
+		arc['features'] = np.load(fpath, mmap_mode='r')
+
+	return arc
+
+# isoform offsets (from 0) and intron sites of one gene
+def gene_arrays(arc, ID):
+
+	g = arc['genes'][ID]
+	offs = arc['offsets'][g['first']:g['first']+g['isoforms']+1]
+	sites = arc['sites'][offs[0]:offs[-1]]
+
+	return np.asarray(offs) - offs[0], sites
+
+def gene_features(arc, ID):
+
+	if arc['features'] is None: return None
+	g = arc['genes'][ID]
+
+	return arc['features'][g['first']:g['first']+g['isoforms']]
+
+# same dicts as aml.apc, seq is only filled in if given
+def gene_isoforms(arc, ID, seq=''):
+
+	g = arc['genes'][ID]
+	offs, sites = gene_arrays(arc, ID)
+	sites = sites.tolist()
+	apc_isoforms = []
+	for k in range(g['isoforms']):
+		introns = [tuple(s) for s in sites[offs[k]:offs[k+1]]]
+		exons = []
+		exbeg = g['beg']
+		for d, a in introns:
+			exons.append((exbeg, d-1))
+			exbeg = a + 1
+		exons.append((exbeg, g['end']))
+		apc_isoforms.append({
+			'seq': seq,
+			'beg': g['beg'],
+			'end': g['end'],
+			'exons': exons,
+			'introns': introns,
+			'score': 0
+		})
+
+	return apc_isoforms
+
+# features depend on the models, the model files are recorded in meta
+def write_features(arc, features, models):
+
+	features = np.asarray(features, dtype=np.float64)
+	assert len(features) == len(arc['offsets']) - 1, 'one value per isoform'
+	fpath = os.path.join(arc['path'], 'features.npy')
+	np.save(fpath+'.tmp.npy', features)
+	os.replace(fpath+'.tmp.npy', fpath)
+	arc['meta']['features'] = models
+	mpath = os.path.join(arc['path'], 'meta.json')
+	with open(mpath+'.tmp', 'w') as fp:
+		json.dump(arc['meta'], fp, indent=1)
+	os.replace(mpath+'.tmp', mpath)
+	arc['features'] = np.load(fpath, mmap_mode='r')
@@ -1,53 +1,56 @@
+import gff_lib as gl
+
 def get_gff_intron_probs(gff):
 
-	with open(gff) as fp:
-		introns = {}
-		total_score = 0
-		for line in fp.readlines():
-			if line.startswith('#'): continue
-			line = line.rstrip()
-			line = line.split('\t')
-			if len(line) < 8: continue
-			if line[2] == 'intron': #and line[6] == '+': why was this here?
-				beg = int(line[3])
-				end = int(line[4])
-				score = line[5]
-				intron = (beg, end)
-				if score == '.': introns[intron] = 0
-				else: 
-					if intron not in introns: introns[intron] = 0
-					introns[intron] += float(score)
-					total_score += float(score)
-		
-		for i in introns:
-			introns[i] = introns[i]/total_score
+	introns = {}
+	total_score = 0
+	for f in gl.gff_features(gff, 'intron'): 
+		intron = (f['beg'], f['end'])
+		if f['score'] is None: introns[intron] = 0
+		else: 
+			if intron not in introns: introns[intron] = 0
+			introns[intron] += f['score']
+			total_score += f['score']
+	
+	for i in introns:
+		introns[i] = introns[i]/total_score
+
+	return introns
+
+# same as get_gff_intron_probs on the gff written by apc_isogen.py
+# intron scores are the isoform probabilities as written, {:.5e}
+def get_apc_intron_probs(isoforms, iso_probs):
 
-		return introns
+	introns = {}
+	total_score = 0
+	for iso, iso_prob in zip(isoforms, iso_probs):
+		score = float('{:.5e}'.format(iso_prob))
+		for intron in iso['introns']:
+			intron = (intron[0]+1, intron[1]+1)
+			if intron not in introns: introns[intron] = 0
+			introns[intron] += score
+			total_score += score
 
-def get_mdist(introns1, introns2):	
+	for i in introns:
+		introns[i] = introns[i]/total_score
 
-	for i in introns1:
-		if i not in introns2:
-			introns2[i] = 0
-	for i in introns2:
-		if i not in introns1:
-			introns1[i] = 0
+	return introns
 
-	introns1 = dict(sorted(introns1.items(), 
-					key=lambda item: item[1], reverse=True))
+# does not modify introns1 or introns2, introns missing from one are 0
+# summed in order of decreasing introns1 probability, as before
+# dist_lib.py has the same distance for many distributions at once
+def get_mdist(introns1, introns2):
+
+	keys = list(introns1) + [i for i in introns2 if i not in introns1]
+	keys = sorted(keys, key=lambda i: introns1.get(i, 0), reverse=True)
 
 	dd = 0
 	isonum = 0
-	for i in introns1:
-		beg = i[0]
-		end = i[1]
-		iprob1 = '{0:.6f}'.format(introns1[i])
-		iprob2 = '{0:.6f}'.format(introns2[i])
-		#print(f'{introns1[i]}\t{introns2[i]}')
+	for i in keys:
 		isonum += 1
-		d = introns1[i] - introns2[i]
+		d = introns1.get(i, 0) - introns2.get(i, 0)
 		dd += abs(d)
-		
+
 	return float('{0:.6f}'.format(dd)), isonum
 
 def icost_groups(icost_gffs, wb_gffs):
@@ -0,0 +1,96 @@
+import json
+import os
+import numpy as np
+import mdist_lib as mdl
+
+# reference (WormBase) intron distributions, parsed and normalized once
+# ref = {'introns': [(beg, end), ...], 'index': {intron: i}, 'probs': array}
+# introns keep the order of mdl.get_gff_intron_probs, so distances are
+# summed in the same order as before
+# entries are keyed by path and are dropped if the file size or mtime change
+
+_refs = {}
+
+def _key(gff):
+
+	path = os.path.abspath(gff)
+	st = os.stat(path)
+
+	return path, st.st_mtime_ns, st.st_size
+
+def _make_ref(introns, probs):
+
+	return {
+		'introns': introns,
+		'index': {intron: i for i, intron in enumerate(introns)},
+		'probs': np.array(probs, dtype=float)
+	}
+
+def get_ref(gff):
+
+	key = _key(gff)
+	if _refs.get(key[0], (None,))[0] != key:
+		iprobs = mdl.get_gff_intron_probs(gff)
+		_refs[key[0]] = (key, _make_ref(list(iprobs), list(iprobs.values())))
+
+	return _refs[key[0]][1]
+
+# same dict as mdl.get_gff_intron_probs, a new copy every call
+def ref_introns(gff):
+
+	ref = get_ref(gff)
+	return dict(zip(ref['introns'], ref['probs'].tolist()))
+
+# reference probabilities aligned to another intron index
+# ref_only is the probability of reference introns not in introns
+# isonum is the size of the union, as counted by mdl.get_mdist
+def align_ref(ref, introns):
+
+	aligned = np.zeros(len(introns))
+	seen = np.zeros(len(ref['introns']), dtype=bool)
+	for j, intron in enumerate(introns):
+		i = ref['index'].get(intron)
+		if i is None: continue
+		aligned[j] = ref['probs'][i]
+		seen[i] = True
+	ref_only = sum(p for p, s in zip(ref['probs'].tolist(), seen) if not s)
+	isonum = len(introns) + int((~seen).sum())
+
+	return aligned, ref_only, isonum
+
+##### on disk #####
+
+def load_cache(fpath):
+
+	if not os.path.exists(fpath): return 0
+	with open(fpath, 'r') as fp:
+		saved = json.load(fp)
+
+	n = 0
+	for path in saved:
+		entry = saved[path]
+		if not os.path.exists(path): continue
+		key = _key(path)
+		if [key[1], key[2]] != [entry['mtime'], entry['size']]: continue
+		introns = [tuple(i) for i in entry['introns']]
+		_refs[path] = (key, _make_ref(introns, entry['probs']))
+		n += 1
+
+	return n
+
+def save_cache(fpath):
+
+	saved = {}
+	for path in _refs:
+		key, ref = _refs[path]
+		saved[path] = {
+			'mtime': key[1],
+			'size': key[2],
+			'introns': ref['introns'],
+			'probs': ref['probs'].tolist()
+		}
+
+	tmp = f'{fpath}.tmp'
+	with open(tmp, 'w') as fp:
+		json.dump(saved, fp)
+	os.replace(tmp, fpath)
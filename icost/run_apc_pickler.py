@@ -1,6 +1,8 @@
 import argparse
 import os
 import subprocess
+import apc_model_lib as aml
+import isoarc_lib as iarc
 
 parser = argparse.ArgumentParser()
 parser.add_argument('apc_dir', type=str, metavar='<directory>',
@@ -11,6 +13,8 @@ parser.add_argument('--outdir', type=str, metavar='<outdir path>',
 	required=False, help='/path/ to outdir')
 parser.add_argument('--limit', type=int, metavar='<int>',
 	required=False, help='limit number of files to pkl, for testing')
+parser.add_argument('--archive', action='store_true',
+	help='run apc in-process and write one isoform archive, not pickles')
 
 parser.add_argument('--max_splice', required=False, type=int, default=3,
 	metavar='<int>', help='maximum number of splicing events %(default)d')
@@ -34,7 +38,10 @@ for gfile in os.listdir(args.apc_dir):
 
 program = 'apc_pickler.py'
 apc_dir = args.apc_dir
-if args.outdir:
+if args.archive:
+	if args.outdir: outdir = args.outdir+'apc_archive/'
+	else: outdir = 'apc_archive/'
+elif args.outdir:
 	outdir = args.outdir+'apc_pickles/'
 	os.makedirs(os.path.dirname(outdir), exist_ok=True)
 else:
@@ -47,7 +54,31 @@ min_intron = args.min_intron
 min_exon = args.min_exon
 flank = args.flank
 
-if args.read_gff:
+# one columnar archive for all genes, see isoarc_lib.py
+# each gene is written as soon as apc is done with it
+def archive_genes():
+
+	count = 0
+	for fID in sorted(fastas):
+		seqid, seq = None, None
+		for seqid, seq in aml.read_fastas(apc_dir + fastas[fID]):
+			seqid = seqid
+			seq = seq
+		if args.read_gff:
+			dons, accs = aml.read_gff_sites(seq, apc_dir + gffs[fID])
+		else:
+			dons, accs = aml.get_gtag(seq)
+		apc_isoforms, trials = aml.apc(dons, accs, max_splice, min_intron,
+			min_exon, flank, seq)
+		print(fID, len(apc_isoforms))
+		yield fID, seqid, seq, apc_isoforms
+		count += 1
+		if args.limit and count == args.limit: break
+
+if args.archive:
+	iarc.write_archive(archive_genes(), outdir)
+	print(outdir)
+elif args.read_gff:
 	count = 0
 	for fID in fastas:
 		fpath = apc_dir + fastas[fID]
@@ -1,32 +1,171 @@
 import argparse
+import asyncio
 import json
 import os
-import subprocess
+import shlex
+import signal
+import sys
+import time
 
-parser = argparse.ArgumentParser()
-parser.add_argument('config_dir', type=str, 
-	help='directory with config.json files for individual genes')
-parser.add_argument('--program', required=False, type=str, 
+parser = argparse.ArgumentParser(
+	description='run optiso on every config file, several at a time')
+parser.add_argument('config_dir', type=str, nargs='+',
+	help='directories with config.json files for individual genes')
+parser.add_argument('--program', required=False, type=str,
 	default='./isoformer', help='algorithm version to use %(default)s')
+parser.add_argument('--optiso', required=False, type=str, default='./optiso',
+	metavar='<exec>', help='optimizer to run on each config [%(default)s]')
+parser.add_argument('--optiso_args', required=False, type=str, default='',
+	metavar='<str>', help='more arguments for optiso, e.g. "--cpu 2"')
+parser.add_argument('--jobs', required=False, type=int, default=1,
+	metavar='<int>', help='configs running at the same time [%(default)i]')
+parser.add_argument('--timeout', required=False, type=float, default=0,
+	metavar='<sec>', help='kill a run after this many seconds, 0 never'
+	' [%(default)g]')
+parser.add_argument('--retries', required=False, type=int, default=1,
+	metavar='<int>', help='reruns of a failed config [%(default)i]')
+parser.add_argument('--out', required=False, type=str,
+	default='optiso_out.json', metavar='<file>',
+	help='best genotype and fitness of every config, by config path'
+	' [%(default)s]')
+parser.add_argument('--failed', required=False, type=str,
+	default='optiso_failed.json', metavar='<file>',
+	help='genes that failed every attempt, with the reason [%(default)s]')
+parser.add_argument('--log_dir', required=False, type=str, metavar='<directory>',
+	help='keep the stdout and stderr of every run')
 
 arg = parser.parse_args()
 
-sum_params = {}
-for file in os.listdir(arg.config_dir):
-	iid = file.split('.')[0]
-	name = f'ch.{iid}'	
-	cmd = (
-		f'./optiso {arg.config_dir}{file} --program {arg.program} '
-	)
-	print(name)
-	result = subprocess.run(cmd, shell=True, capture_output=True)
-	jstring = result.stdout.decode('utf-8')
-	print(jstring)
-	# fails make json object, idk why
-	#ginfo = json.loads(jstring)
-	#sum_params[name] = ginfo
-
-#with open('optiso_out.json', 'w') as jfile:
-#	jfile.write(json.dumps(sum_params, indent=4))
-# fails 
-	
+# optiso prints progress lines (--verbose) and then the best guy as json
+# the last line that parses as a json object is the result
+def parse_output(stdout):
+
+	decoder = json.JSONDecoder()
+	for line in reversed(stdout.splitlines()):
+		start = line.find('{')
+		if start == -1: continue
+		try:
+			obj, end = decoder.raw_decode(line[start:])
+		except json.JSONDecodeError:
+			continue
+		if isinstance(obj, dict): return obj
+
+	return None
+
+# gene name of a config, only a label, configs are keyed by their path
+def config_name(fpath):
+
+	try:
+		with open(fpath, 'r') as fp:
+			data = json.load(fp)['data']
+		if len(data) == 1: return data[0]['name']
+	except (OSError, ValueError, KeyError, IndexError, TypeError):
+		pass
+	iid = os.path.basename(fpath).split('.')[0]
+
+	return f'ch.{iid}'
+
+# optiso runs in its own session, a timeout kills everything it started
+def kill_group(proc):
+
+	try:
+		os.killpg(proc.pid, signal.SIGKILL)
+	except ProcessLookupError:
+		pass
+
+async def run_config(name, fpath, sem):
+
+	cmd = [arg.optiso, fpath, '--program', arg.program]
+	cmd += shlex.split(arg.optiso_args)
+	error = None
+	for attempt in range(1, arg.retries + 2):
+		async with sem:
+			t0 = time.time()
+			try:
+				proc = await asyncio.create_subprocess_exec(*cmd,
+					stdout=asyncio.subprocess.PIPE,
+					stderr=asyncio.subprocess.PIPE, start_new_session=True)
+			except OSError as e:
+				proc = None
+				out, err = b'', b''
+				error = f'cannot start {arg.optiso}: {e}'
+			else:
+				try:
+					out, err = await asyncio.wait_for(proc.communicate(),
+						arg.timeout if arg.timeout > 0 else None)
+				except asyncio.TimeoutError:
+					kill_group(proc)
+					out, err = await proc.communicate()
+					error = f'timeout after {arg.timeout:g}s'
+				else:
+					error = None
+			secs = time.time() - t0
+
+		out = out.decode('utf-8', errors='replace')
+		err = err.decode('utf-8', errors='replace')
+		returncode = proc.returncode if proc else None
+		if arg.log_dir:
+			for ext, text in (('out', out), ('err', err)):
+				label = fpath.replace('/', '_')
+				with open(f'{arg.log_dir}/{label}.{attempt}.{ext}', 'w') as fp:
+					fp.write(text)
+
+		if error is None and returncode != 0:
+			error = f'exit status {returncode}'
+		result = None
+		if error is None:
+			result = parse_output(out)
+			if result is None: error = 'no json object in stdout'
+		if error is None:
+			print(f'{fpath}\t{name}\tdone\t{secs:.1f}s', flush=True)
+			result['name'] = name
+			return fpath, result, None
+
+		print(f'{fpath}\t{name}\t{error}\tattempt {attempt}', file=sys.stderr,
+			flush=True)
+		failure = {
+			'name': name,
+			'error': error,
+			'returncode': returncode,
+			'attempts': attempt,
+			'stderr': err[-2000:]
+		}
+
+	return fpath, None, failure
+
+# written to a temporary file and renamed, never left half written
+def write_json(obj, fpath):
+
+	tmp = f'{fpath}.tmp'
+	with open(tmp, 'w') as fp:
+		fp.write(json.dumps(obj, indent=4))
+	os.replace(tmp, fpath)
+
+async def main():
+
+	# relative paths, the same gene can be in several shard directories
+	configs = {}
+	for config_dir in arg.config_dir:
+		for file in sorted(os.listdir(config_dir)):
+			if not file.endswith('.json'): continue
+			fpath = os.path.relpath(os.path.join(config_dir, file))
+			configs[fpath] = config_name(fpath)
+	if arg.log_dir: os.makedirs(arg.log_dir, exist_ok=True)
+
+	sem = asyncio.Semaphore(arg.jobs)
+	tasks = [run_config(configs[fpath], fpath, sem) for fpath in configs]
+	sum_params = {}
+	failed = {}
+	for task in asyncio.as_completed(tasks):
+		fpath, ginfo, failure = await task
+		if failure: failed[fpath] = failure
+		else: sum_params[fpath] = ginfo
+		write_json({n: sum_params[n] for n in sorted(sum_params)}, arg.out)
+
+	if not tasks: write_json({}, arg.out)
+	write_json({n: failed[n] for n in sorted(failed)}, arg.failed)
+	print(f'{len(sum_params)} done, {len(failed)} failed', file=sys.stderr)
+	for fpath in sorted(failed):
+		print(f'{fpath}\t{failed[fpath]["error"]}', file=sys.stderr)
+
+asyncio.run(main())
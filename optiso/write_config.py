@@ -1,6 +1,9 @@
 import argparse
+import heapq
+import math
 import os
 import json
+import numpy as np
 
 parser = argparse.ArgumentParser()
 parser.add_argument('wb_dir', type=str, metavar='<directory>',
@@ -20,6 +23,13 @@ parser.add_argument('--flank', required=False, type=int, default=100,
 	metavar='<int>', help='genomic flank on each side [%(default)i]')
 parser.add_argument('--limit', required=False, type=int, default=100,
 	metavar='<int>', help='limit number of transcripts [%(default)i]')
+parser.add_argument('--shards', required=False, type=int, default=0,
+	metavar='<int>', help='number of outfigs directories, 0 for one per 70'
+	' genes [%(default)i]')
+parser.add_argument('--cost', required=False, type=str, default='isoforms',
+	choices=['isoforms', 'sites'], help='gene cost is length times the'
+	' number of isoforms, or times the donor/acceptor combinations apc'
+	' tries [%(default)s]')
 
 arg = parser.parse_args()
 
@@ -83,16 +93,137 @@ def add_gene(config, name, paths):
 
 	return gconfig
 
-c1 = 0
-c2 = 1
-for gene in fpaths:
-	gconfig = add_gene(config, gene, fpaths[gene])
-	iid = gene.split('.')[1]
+##### gene cost #####
+
+def read_seq(fasta):
+
+	seq = ''
+	with open(fasta, 'r') as fp:
+		for line in fp.readlines():
+			if not line.startswith('>'): seq += line.rstrip()
+
+	return seq
+
+# same sites as apc_model_lib.get_gtag and read_gff_sites, 0-based
+def gene_sites(seq, gff):
+
+	dons = set()
+	accs = set()
+	if gff:
+		with open(gff, 'r') as fp:
+			for line in fp.readlines():
+				fields = line.rstrip().split('\t')
+				if len(fields) < 5 or fields[2] != 'intron': continue
+				beg = int(fields[3]) - 1
+				end = int(fields[4]) - 1
+				if seq[beg:beg+2] == 'GT': dons.add(beg)
+				if seq[end-1:end+1] == 'AG': accs.add(end)
+	else:
+		for i in range(len(seq)):
+			if seq[i:i+2] == 'GT': dons.add(i)
+			if seq[i:i+2] == 'AG': accs.add(i+1)
+
+	return sorted(dons), sorted(accs)
+
+# donor/acceptor combinations tried by apc_model_lib.apc
+def count_trials(dons, accs, maxs):
+
+	return sum(math.comb(len(dons), n) * math.comb(len(accs), n)
+		for n in range(1, min(len(dons), len(accs), maxs) + 1))
+
+# isoforms with 1 to maxs introns that pass the intron and exon lengths
+# introns are sorted by acceptor, ways[j] counts isoforms ending in intron j
+def count_isoforms(seq, dons, accs, maxs, minin, minex, flank):
+
+	if not dons or not accs: return 0
+	D, A = np.meshgrid(dons, accs, indexing='ij')
+	D, A = D.ravel(), A.ravel()
+	keep = A - D + 1 >= minin
+	order = np.argsort(A[keep], kind='stable')
+	D, A = D[keep][order], A[keep][order]
+
+	last = len(seq) - flank - 1 - A >= minex
+	ways = (D - flank >= minex).astype(float)
+	total = ways[last].sum()
+	for n in range(2, maxs + 1):
+		cum = np.concatenate([[0], np.cumsum(ways)])
+		ways = cum[np.searchsorted(A, D - minex - 1, side='right')]
+		total += ways[last].sum()
+
+	return int(total)
+
+def gene_cost(name, paths):
+
+	seq = read_seq(paths[0])
+	dons, accs = gene_sites(seq, paths[1] if arg.gff else None)
+	if arg.cost == 'sites': n = count_trials(dons, accs, arg.max_splice)
+	else: n = count_isoforms(seq, dons, accs, arg.max_splice, arg.min_intron,
+		arg.min_exon, arg.flank)
+
+	return {
+		'name': name,
+		'length': len(seq),
+		'donors': len(dons),
+		'acceptors': len(accs),
+		'n': n,
+		'cost': len(seq) * (n + 1)
+	}
+
+##### sharding #####
+
+# longest processing time first, each gene goes to the least loaded shard
+def lpt_shards(costs, nshards):
+
+	heap = [(0, k) for k in range(nshards)]
+	shards = [[] for k in range(nshards)]
+	for info in sorted(costs, key=lambda info: (-info['cost'], info['name'])):
+		load, k = heapq.heappop(heap)
+		shards[k].append(info)
+		heapq.heappush(heap, (load + info['cost'], k))
+
+	return shards
+
+costs = [gene_cost(gene, fpaths[gene]) for gene in fpaths]
+nshards = arg.shards if arg.shards else math.ceil(len(costs) / 70)
+shards = lpt_shards(costs, max(1, min(nshards, len(costs))))
+
+# outfigs directories past the new shard count are left from an earlier
+# split with more shards, run_optiso.py would run their configs again
+for d in sorted(os.listdir('.')):
+	if not d.startswith('outfigs') or not d[7:].isdigit(): continue
+	if int(d[7:]) <= len(shards) or not os.path.isdir(d): continue
+	for file in os.listdir(d):
+		if file.endswith('.config.json') or file == 'manifest.tsv':
+			os.remove(f'{d}/{file}')
+	if os.listdir(d): print(f'{d}/ has other files, left in place')
+	else:
+		os.rmdir(d)
+		print(f'{d}/ removed, left from an earlier split')
+
+for c2, shard in enumerate(shards, 1):
 	if not os.path.exists(f'outfigs{c2}/'): os.makedirs(f'outfigs{c2}/')
-	with open(f'outfigs{c2}/{iid}.config.json', 'w') as jfile:
-		json.dump(gconfig, jfile, indent=4)
-	c1 += 1
-	if c1%70 == 0: c2 += 1
+
+	# configs of an earlier split would end up in two shards
+	for file in os.listdir(f'outfigs{c2}/'):
+		if file.endswith('.config.json'): os.remove(f'outfigs{c2}/{file}')
+	for info in shard:
+		gene = info['name']
+		gconfig = add_gene(config, gene, fpaths[gene])
+		iid = gene.split('.')[1]
+		with open(f'outfigs{c2}/{iid}.config.json', 'w') as jfile:
+			json.dump(gconfig, jfile, indent=4)
+
+	# manifest.tsv, not .json, so run_optiso.py does not take it for a config
+	with open(f'outfigs{c2}/manifest.tsv', 'w') as fp:
+		fp.write(f'# cost: {sum(info["cost"] for info in shard)}\n')
+		fp.write(f'name\tconfig\tlength\tdonors\tacceptors\t{arg.cost}\tcost\n')
+		for info in shard:
+			iid = info['name'].split('.')[1]
+			fp.write(f'{info["name"]}\t{iid}.config.json\t{info["length"]}'
+				f'\t{info["donors"]}\t{info["acceptors"]}\t{info["n"]}'
+				f'\t{info["cost"]}\n')
+	print(f'outfigs{c2}/\t{len(shard)} genes\tcost'
+		f' {sum(info["cost"] for info in shard)}')
 
 
 